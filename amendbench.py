@@ -0,0 +1,129 @@
+# amendbench.py
+
+r'''Benchmark for passing amendments (bin/motions/amendments.py).
+
+For each size, builds a synthetic bylaws document with a primary amendment struck out and
+inserted throughout (and the same as a secondary amendment), and times:
+
+    regex          the regex split and substitutions that pass used to do (passed text only)
+    regex_redline  those, and the regex substitutions for a redline, to compare with apply
+    apply          amendments.apply, the passed text and the redline html together
+    markdown       rendering the amendment to html, as watcher.py does (for scale)
+
+Reports the best time over --repeat runs of each, in seconds, as json:
+
+    python amendbench.py --articles 10,100,1000 --output results.json
+'''
+
+import os
+import sys
+import re
+import json
+import time
+import random
+import argparse
+from html import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin'))
+
+from motions.amendments import apply
+from render import md
+
+
+Words = ("the bylaws shall be amended by striking inserting members officers committee "
+         "chairman vote quorum meeting motion").split()
+
+def make_bylaws(articles, sections=5, secondary=False):
+    r'''Returns a synthetic amendment file: a bylaws document of articles, about one in five
+    paragraphs with something struck out and/or inserted, followed by the amendment.
+    '''
+    rand = random.Random(articles)
+    def words(n):
+        return ' '.join(rand.choice(Words) for _ in range(n))
+    parts = []
+    for article in range(1, articles + 1):
+        parts.append(f"## Article {article}\n")
+        for section in range(1, sections + 1):
+            para = f"{section}. {words(30)}"
+            if rand.random() < 0.2:
+                para += f" ~~{words(6)}~~"
+            if rand.random() < 0.2:
+                para += f" ++{words(8)}++"
+            parts.append(para + f" {words(10)}\n")
+    parts.append("---\nAmend the bylaws as shown.\n")
+    if secondary:
+        parts.append("---\nAmend the amendment as shown.\n")
+    return '\n'.join(parts)
+
+
+# What pass did before amendments.py:
+Section_re = re.compile(r'^(-{3,})$', re.MULTILINE)
+Del_re = re.compile(r'~~.*?~~', re.DOTALL)
+Ins_re = re.compile(r'\+\+(.*?)\+\+', re.DOTALL)
+
+def pass_block(text):
+    return Ins_re.sub(r'\1', Del_re.sub('', text))
+
+def regex_pass(text, secondary=False):
+    sections = Section_re.split(text)
+    if secondary:
+        return sections[0] + sections[1] + pass_block(sections[2])
+    return pass_block(sections[0])
+
+def regex_redline(text, secondary=False):
+    redline = Ins_re.sub(r'<ins>\1</ins>',
+                         Del_re.sub(lambda m: f"<del>{m.group()[2:-2]}</del>",
+                                    escape(text, quote=False)))
+    return regex_pass(text, secondary), \
+           '<div class="redline">' + Section_re.sub('<hr>', redline) + '</div>'
+
+def markdown_render(text):
+    md.reset()
+    return md.convert(text)
+
+
+def best_time(fn, text, repeat, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text, *args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def run_test(args, articles, secondary):
+    text = make_bylaws(articles, secondary=secondary)
+    assert apply(text, secondary).passed == regex_pass(text, secondary)
+    return {
+        'articles': articles,
+        'secondary': secondary,
+        'bytes': len(text.encode('utf-8')),
+        'regex': best_time(regex_pass, text, args.repeat, secondary),
+        'regex_redline': best_time(regex_redline, text, args.repeat, secondary),
+        'apply': best_time(apply, text, args.repeat, secondary),
+        'markdown': best_time(markdown_render, text, args.repeat) if args.markdown else None,
+    }
+
+
+parser = argparse.ArgumentParser(description="benchmark for passing amendments")
+parser.add_argument('--articles', '-a', default='10,100,1000',
+                    type=lambda s: [int(n) for n in s.split(',')],
+                    help='comma separated numbers of articles (5 paragraphs each) to test with')
+parser.add_argument('--repeat', '-r', type=int, default=5, help='runs of each, best is reported')
+parser.add_argument('--no-markdown', dest='markdown', default=True, action='store_false',
+                    help="don't time the markdown rendering (slow on big documents)")
+parser.add_argument('--output', '-o', help='write the results (json) here, instead of stdout')
+args = parser.parse_args()
+
+results = []
+for articles in args.articles:
+    for secondary in (False, True):
+        result = run_test(args, articles, secondary)
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+if args.output:
+    with open(args.output, 'wt') as file:
+        json.dump(results, file, indent=2)
+else:
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,7 @@
+# motions
+
+r'''Motion management for meetings: the agenda, amendments, and which motions passed or failed.
+
+The commands are in commands.py, cli.py runs them (from the scripts in bin), and daemon.py can
+keep them loaded between commands.
+'''
@@ -0,0 +1,181 @@
+# amendments.py
+
+r'''The amendment markup: ~~struck out~~ and ++inserted++ text, in sections separated by lines of
+three or more '-'.
+
+A primary amendment file has two sections: the motion with the amendment's markup, and the
+amendment itself.  A secondary amendment file has three: the motion (with the primary amendment's
+markup), the primary amendment with the secondary amendment's markup, and the secondary amendment.
+
+tokenize goes through the file once, and apply builds the text as passed and the redline html from
+the same tokens:
+
+    >>> applied = apply('Keep ~~this~~ ++that++.\n---\namend the motion by ...')
+    >>> applied.passed
+    'Keep  that.\n'
+    >>> applied.redline
+    '<div class="redline">Keep <del>this</del> <ins>that</ins>.\n<hr>\namend the motion by ...</div>'
+
+The markup doesn't nest.  A ~~ or ++ without a closing one (before the end of its section) is
+left as is.
+'''
+
+import sys
+from html import escape
+
+
+def rules(text):
+    r'''Yields (start, end) of each line of three or more '-'s in text, the rules between sections.
+
+    These are the matches of re.compile(r'^-{3,}$', re.MULTILINE), but str.find only stops at the
+    lines starting with '---', where the regex tries every line.  That's most of the time it
+    takes to pass a long document.
+
+    >>> list(rules('---\na\n-----\n--- b\n---'))
+    [(0, 3), (6, 11), (18, 21)]
+    '''
+    if text.startswith('---'):
+        start = 0
+    else:
+        start = text.find('\n---') + 1
+        if not start:
+            return
+    while True:
+        end = text.find('\n', start)
+        if end < 0:
+            end = len(text)
+        if not text[start:end].strip('-'):
+            yield start, end
+        start = text.find('\n---', end) + 1
+        if not start:
+            return
+
+
+def markup(text, start, end):
+    r'''Yields (at, after, kind) for the markup in text[start:end], in order.
+
+    kind is 'del' for ~~...~~ (text[at:after] including the ~~s), or '++' for each ++ outside of
+    those.  The ~~s pair up first, like the del_re.sub that passing used to start with, so a ++
+    inside a deletion doesn't count.  Unlike del_re.sub, deleting the text between two +s doesn't
+    make a ++ out of them.
+    '''
+    d = text.find('~~', start, end)
+    close = -1 if d < 0 else text.find('~~', d + 2, end)
+    p = text.find('++', start, end)
+    while True:
+        if close >= 0 and (p < 0 or d < p):
+            yield d, close + 2, 'del'
+            if 0 <= p < close + 2:
+                p = text.find('++', close + 2, end)
+            d = text.find('~~', close + 2, end)
+            close = -1 if d < 0 else text.find('~~', d + 2, end)
+        elif p >= 0:
+            yield p, p + 2, '++'
+            p = text.find('++', p + 2, end)
+        else:
+            break
+
+def tokenize_section(text, start, end):
+    r'''Yields the (kind, start, end) tokens for text[start:end], which has no section rules.
+
+    The tokens after a ++ are held until the ++ closing it turns up.  If it never does, the ++
+    and what follows it are just text.
+    '''
+    pos = start         # the end of the last token
+    opened = None       # where the ++ starting the current insertion is
+    held = []
+    for at, after, kind in markup(text, start, end):
+        if at > pos:
+            held.append(('text' if opened is None else 'ins', pos, at))
+        if kind == 'del':
+            held.append(('del', at + 2, after - 2))
+        elif opened is None:
+            opened = at
+            first_held = len(held)
+        else:
+            opened = None
+        pos = after
+        if opened is None:
+            yield from held
+            held.clear()
+    if opened is not None:
+        yield from held[:first_held]
+        yield 'text', opened, opened + 2
+        for kind, at, after in held[first_held:]:
+            yield ('text' if kind == 'ins' else kind), at, after
+    if pos < end:
+        yield 'text', pos, end
+
+def tokenize(text):
+    r'''Yields the (kind, start, end) tokens for text, in order.
+
+    kind is 'text', 'del' (between ~~s), 'ins' (between ++s) or 'rule' (a line of '-'s between
+    sections), and text[start:end] is what it covers, without the ~~s or ++s.  A deletion inside
+    an insertion splits it in two.
+
+    >>> text = 'a ~~b~~ ++c ~~d~~ e++\n---\n++f ~~g'
+    >>> [(kind, text[start:end]) for kind, start, end in tokenize(text)]
+    [('text', 'a '), ('del', 'b'), ('text', ' '), ('ins', 'c '), ('del', 'd'), ('ins', ' e'), ('text', '\n'), ('rule', '---'), ('text', '\n'), ('text', '++'), ('text', 'f ~~g')]
+    '''
+    start = 0
+    for rule_start, rule_end in rules(text):
+        yield from tokenize_section(text, start, rule_start)
+        yield 'rule', rule_start, rule_end
+        start = rule_end
+    yield from tokenize_section(text, start, len(text))
+
+
+class Applied:
+    r'''The result of apply.
+
+    passed is the text as passed, redline is the html showing the changes, and sections is the
+    number of sections found.
+    '''
+    def __init__(self, passed, redline, sections):
+        self.passed = passed
+        self.redline = redline
+        self.sections = sections
+
+def apply(text, secondary=False):
+    r'''Passes the amendment in text, returning an Applied.
+
+    For a primary amendment, passed is the first section with the markup applied.  For a
+    secondary amendment, it's the first section as is, its rule, and the second section with the
+    markup applied, which is the primary amendment as amended.  The redline covers all of text.
+
+    >>> apply('m ~~x~~\n---\nprimary ~~a~~++b++\n---\nsecondary', secondary=True).passed
+    'm ~~x~~\n---\nprimary b\n'
+    '''
+    passed = []
+    redline = ['<div class="redline">']
+    section = 0
+    applying = 1 if secondary else 0      # the section being passed
+    for kind, start, end in tokenize(text):
+        if kind == 'rule':
+            section += 1
+            redline.append('<hr>')
+            if section == applying:
+                passed.append(text[:end])
+            continue
+        value = text[start:end]
+        if kind == 'text':
+            if section == applying:
+                passed.append(value)
+            redline.append(escape(value, quote=False))
+        else:
+            if kind == 'ins' and section == applying:
+                passed.append(value)
+            redline.append(f"<{kind}>{escape(value, quote=False)}</{kind}>")
+    redline.append('</div>')
+    return Applied(''.join(passed), ''.join(redline), section + 1)
+
+
+def main(argv, secondary=False):
+    r'''Prints the file named in argv[1] (or stdin) with the amendment passed.
+    '''
+    if len(argv) > 1 and argv[1] != '-':
+        with open(argv[1]) as f:
+            text = f.read()
+    else:
+        text = sys.stdin.read()
+    sys.stdout.write(apply(text, secondary).passed)
@@ -0,0 +1,146 @@
+# cli.py
+
+r'''The single entry point for the motion commands.
+
+The scripts in bin (agenda, amend, ..., start) all just call main, which runs the command named by
+the script, or by the first argument for 'python -m motions <command>'.
+
+If the motions daemon is running (see daemon.py), the command is sent to it to run, so all this
+has to import is enough to talk to it.  Otherwise the command is imported and run here.
+'''
+
+import os
+import sys
+
+from .push import Environ
+
+
+def socket_path():
+    r'''Returns the path of the daemon's Unix socket.
+
+    This is $MOTIONS_SOCKET, or motions-<uid>.sock in $XDG_RUNTIME_DIR (or /tmp).
+    '''
+    path = os.environ.get('MOTIONS_SOCKET')
+    if path:
+        return path
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'), f"motions-{os.getuid()}.sock")
+
+
+def parse_args(name, fn, args):
+    r'''Parses args (a list of str) for command fn, and returns fn's keyword arguments.
+    '''
+    import argparse
+    from .commands import getargs
+
+    doc = fn.__doc__
+    if doc is None:
+        parser = argparse.ArgumentParser(prog=name)
+    else:
+        parser = argparse.ArgumentParser(prog=name, description=doc.strip('\n '))
+    arg_translate = {}
+    for arg, kind in getargs(fn):
+        if kind == 'option':
+            parser.add_argument(arg[1:3], arg, default=False, action='store_true')
+            arg = arg.replace('-', '_')
+            arg_translate[arg[2:]] = arg[1:]
+        elif kind == 'required':
+            parser.add_argument(arg)
+        elif kind == 'list':
+            parser.add_argument(arg, nargs='*')
+        else:
+            parser.add_argument(arg, nargs='?', default=kind)
+    args = parser.parse_args(args)
+    return {arg_translate.get(name, name): value for name, value in vars(args).items()}
+
+def run(name, args):
+    r'''Runs command name with args (a list of str) here.
+
+    Returns the Path to run the editor on, if the command wants that.
+    '''
+    from . import commands
+
+    fn = commands.Commands.get(name)
+    if fn is None:
+        print(f"ERROR: unknown command {name!r}, see 'commands'", file=sys.stderr)
+        sys.exit(2)
+    try:
+        fn(**parse_args(name, fn, args))
+    except commands.Edit as e:
+        return e.path
+    return None
+
+def peer_uid(sock, path):
+    r'''Returns the uid of the process at the other end of sock, connected to path.
+
+    This is from SO_PEERCRED where there is one (Linux), otherwise it's the owner of path.
+    '''
+    import socket
+    import struct
+
+    if hasattr(socket, 'SO_PEERCRED'):
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        return struct.unpack('3i', creds)[1]      # pid, uid, gid
+    return os.lstat(path).st_uid
+
+def call_daemon(name, args):
+    r'''Has the daemon run command name with args.
+
+    Returns its reply (see daemon.py), or None if the daemon isn't running.
+
+    The request has MEETING_AUTH in it, and the reply says what to run the editor on, so the
+    daemon must be this user's: anyone can create the socket in /tmp first.  If it's someone
+    else's, the command is run here.
+    '''
+    import json
+    import socket
+
+    path = socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    if peer_uid(sock, path) != os.getuid():
+        print(f"WARNING: {path} isn't this user's, not using the motions daemon",
+              file=sys.stderr)
+        sock.close()
+        return None
+    with sock, sock.makefile('rwb') as f:
+        request = {'argv': [name] + args, 'cwd': os.getcwd(),
+                   'env': {var: os.environ[var] for var in Environ if var in os.environ}}
+        f.write(json.dumps(request).encode('utf-8') + b'\n')
+        f.flush()
+        return json.loads(f.readline())
+
+def edit(path):
+    r'''Replaces this process with $EDITOR on path.
+    '''
+    editor = os.environ['EDITOR']
+    os.execl(editor, os.path.basename(editor), str(path))
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    name = os.path.basename(argv[0])
+    args = argv[1:]
+    if name in ('motions', '__main__.py'):
+        if not args:
+            print("usage: motions <command> [args...], see 'motions commands'", file=sys.stderr)
+            sys.exit(2)
+        name, args = args[0], args[1:]
+    if name in ('daemon', 'motions-daemon'):
+        from .daemon import serve
+        serve(socket_path())
+        return
+    reply = call_daemon(name, args)
+    if reply is None:
+        path = run(name, args)
+    else:
+        sys.stdout.write(reply['stdout'])
+        sys.stderr.write(reply['stderr'])
+        if reply['status']:
+            sys.exit(reply['status'])
+        path = reply['edit']
+    if path is not None:
+        edit(path)
@@ -0,0 +1,350 @@
+# commands.py
+
+r'''The motion commands.
+
+Each command is a function in Commands.  Its arguments are its command line arguments, see
+getargs.  The commands work on the meeting in the current directory.
+'''
+
+import sys
+from pathlib import Path
+import os
+import re
+
+from .amendments import apply
+from .ids import Motion_id
+from .index import Motion_index, read_list
+from .push import push
+
+Metadata = Path("metadata")
+Motiondir = Path('.')
+
+def meta(name):
+    return Metadata / name
+
+Indexes = {}      # meeting directory: Motion_index
+
+def index():
+    r'''Returns the Motion_index for the meeting in the current directory.
+    '''
+    cwd = os.getcwd()
+    ans = Indexes.get(cwd)
+    if ans is None:
+        ans = Indexes[cwd] = Motion_index(Metadata, Motiondir)
+    return ans
+
+class Edit(Exception):
+    r'''Raised to run the editor on path (a Path), which ends the command.
+
+    Whatever ran the command does this, because with the daemon the editor has to run in the
+    terminal of the client, not the daemon.
+    '''
+    def __init__(self, path):
+        super().__init__(path)
+        self.path = path
+
+def get_current(err_no_current=True):
+    r'''Returns current motion as Path.
+    '''
+    cur = meta('current')
+    if cur.exists():
+        return Path(cur.read_text().split()[0])
+    if err_no_current:
+        print("ERROR: no current file", file=sys.stderr)
+        sys.exit(1)
+    return None
+
+def as_list(filename):
+    r'''Returns the first word on each line of filename as a list.
+
+    Lines starting with '#' are ignored.
+    '''
+    return read_list(meta(filename))
+
+def in_file(name, filename):
+    r'''True if name is subordinate_to any motion in filename ('passed' or 'failed').
+
+    Accepts Path as name.
+    '''
+    return index().in_status(name, filename)
+
+def read(filename):
+    with Path(filename).open() as f:
+        return f.read()
+
+def motion_history(motion):
+    r'''Shows the history of motion in chronological order.
+
+    Prunes out failed motions.
+    '''
+    return [Path(motion)] + [Path(name) for name in index().family(motion)
+                                        if not in_file(name, 'failed')]
+
+def final_version(motion):
+    r'''Returns the Path of the final version of main motion motion.
+
+    This is the last version of it (motion, motion.1, ...) in its motion_history.
+    '''
+    return [m for m in motion_history(motion) if Motion_id(m).depth == 0][-1]
+
+def passed_amendments(motion):
+    r'''Yields (amendment, Applied) for each primary amendment to main motion that passed.
+
+    Passing amendment mot-N makes version mot.N of the motion (see pass_), so these are the
+    amendments that the versions of motion came from, in the order they were made.
+    '''
+    base = Motion_id(motion).base
+    for name in index().family(base):
+        id = Motion_id(name)
+        if id.depth == 0 and id.version:
+            amendment = base + '-' + name[len(base) + 1:]
+            if Path(amendment).exists():
+                yield amendment, apply(read(amendment))
+
+def cur_agenda():
+    for motion in index().remaining():
+        yield Path(motion)
+
+def agenda():
+    for motion in cur_agenda():
+        print(motion)
+
+def current(motion=None):
+    r'''Displays or sets current motion.
+    '''
+    if motion is None:
+        print(str(get_current(False)))
+    else:
+        meta('current').write_text(motion + '\n')
+
+def passed():
+    r'''Shows the list of main motions that have passed a vote.
+
+    Amendments that have passed are not shown.
+    '''
+    with meta('passed').open() as f:
+        print(f.read(), end='')
+
+def failed():
+    r'''Shows the list of all motions that have failed a vote.
+
+    This includes amendments.
+    '''
+    with meta('failed').open() as f:
+        print(f.read(), end='')
+
+def minutes(_serial, output='minutes.html'):
+    r'''Writes the final wording of the main motions that passed to output, as one html file.
+
+    Each motion is followed by the redline of each amendment to it that passed.  The motions are
+    rendered like watcher.py does, in parallel unless --serial.  The html is cached in
+    metadata/rendered, so exporting again only renders the motions that changed.
+    '''
+    from .minutes import export
+    motions = [(Motion_id(name).base, final_version(name),
+                [(amendment, applied.redline) for amendment, applied in passed_amendments(name)])
+               for name in as_list('passed')
+               if Motion_id(name).depth == 0]
+    rendered = export(motions, Path(output), meta('rendered'), f"Minutes: {Path.cwd().name}",
+                      workers=1 if _serial else None)
+    print(f"minutes: wrote {len(motions)} motions to {output}, rendered {rendered}")
+
+def start(_no_edit, motion=None):
+    r'''touches motion and runs editor on it.
+
+    If motion is omitted, the current motion is restarted.  The motion is also pushed to the
+    meeting server, if MEETING_URL is set.
+    '''
+    print("start", _no_edit, motion)
+    if motion is None:
+        motion_path = get_current()
+        print("restarting", str(motion_path))
+    else:
+        motion_path = Path(motion)
+        meta('current').write_text(str(motion).rstrip('\n') + '\n')
+    #motion_path.touch()
+    with motion_path.open('at'):
+        pass
+    index().added(motion_path)
+    push(motion_path)
+    if not _no_edit:
+        raise Edit(motion_path)
+
+def next(_no_edit, _dry_run):
+    for motion in cur_agenda():
+        print("next is", str(motion))
+        if _dry_run:
+            return
+        start(_no_edit, motion)
+    print("The agenda is done!")
+
+tail_re = re.compile(r'-[0-9]+(\.[0-9]+)*$')
+
+def tail(motion):
+    m = tail_re.search(str(motion))
+    if m is None:
+        return None
+    return m.group()
+
+def dot_tail(motion):
+    m = tail_re.search(str(motion))
+    if m is None:
+        return None
+    return m.group(1)
+
+def pass_(_no_edit, _dry_run, reason_):
+    motion = get_current()
+    print("pass", str(motion), reason_)
+    check_open(motion)
+    hyphen_count = str(motion).count('-')
+    if hyphen_count:
+        t = tail(motion)
+        assert t is not None and t[0] == '-'
+        dot = Path(str(motion)[:-len(t)] + '.' + t[1:])
+        print("pass: got amendment, creating", dot)
+        if dot.exists():
+            print(f"{str(motion)} already passed", file=sys.stderr)
+            sys.exit(1)
+        if _dry_run:
+            dot = Path('tmp.' + str(dot))
+        if hyphen_count == 1:
+            print("pass: primary amendment")
+            applied = apply(read(motion))
+            assert applied.sections == 2
+        else:
+            assert hyphen_count == 2
+            print("pass: secondary amendment")
+            applied = apply(read(motion), secondary=True)
+            assert applied.sections == 3
+        with dot.open('wt') as f:
+            f.write(applied.passed)
+        print("pass created", str(dot))
+        if not _dry_run:
+            #append('passed', motion, *reason_)
+            start(_no_edit, dot)
+    else:
+        print("pass: got motion, appending", str(motion), "to 'passed'")
+        if not _dry_run:
+            append('passed', motion, *reason_)
+            #FIX: next(_no_edit)
+
+def fail(_no_edit, _dry_run, reason_):
+    motion = get_current()
+    print("fail", str(motion), reason_)
+    check_open(motion)
+    if _dry_run:
+        print("fail appending", str(motion), "to 'failed'")
+    else:
+        append('failed', motion, *reason_)
+    last_hyphen = str(motion).rfind('-')
+    if last_hyphen >= 0:
+        parent = str(motion)[: last_hyphen]
+        print("fail: got amendment, starting", parent)
+        if not _dry_run:
+            start(_no_edit, parent)
+    else:
+        print("fail: got motion")
+        #FIX: next(_no_edit)
+
+def amend(_no_edit, _dry_run):
+    current_motion = get_current()
+    motion = str(current_motion)
+
+    # strip .X
+    dot = motion.find('.')
+    if dot >= 0:
+        motion = motion[:dot]
+
+    print("amend", motion)
+    check_open(motion)
+    hyphen_count = motion.count('-')
+    if hyphen_count > 1:
+        print(f"ERROR: amend {motion}, can't amend a secondary amendment", file=sys.stderr)
+        sys.exit(1)
+    if hyphen_count == 1:
+        kind = 'amendment'
+    else:
+        kind = 'motion'
+    next_num = index().next_number(motion)
+    new_file = Path(motion + f"-{next_num}")
+    print("amend, new_file", str(new_file))
+    if _dry_run:
+        new_file = Path('tmp.' + str(new_file))
+    with new_file.open('wt') as f:
+        with current_motion.open() as old_f:
+            f.write(old_f.read())
+        print("-------------------", file=f)
+        print(f"amend the {kind} by ", file=f)
+    print("amend created", str(new_file))
+    if not _dry_run:
+        start(_no_edit, new_file)
+
+def new(_no_edit, _dry_run):
+    # filenames are: newN
+    last_num = max([int(name[3:]) for name in index().with_prefix('new') if name[3:].isdigit()],
+                   default=0)
+    new_file = Path(f"new{last_num + 1}")
+    print("new", str(new_file))
+    if not _dry_run:
+        start(_no_edit, new_file)
+
+def commands():
+    import inspect
+
+    def get_args(fn):
+        ans = []
+        for arg, kind in getargs(fn):
+            if kind == 'option':
+                ans.append(f" [{arg[1:3]}|{arg}]")
+            elif kind == 'required':
+                ans.append(' ' + arg)
+            elif kind == 'list':
+                ans.append(' ' + arg + '...')
+            else:
+                ans.append(f" [{arg}]")
+        return ''.join(ans)
+    for name, fn in sorted(Commands.items()):
+        print(f"{name}{get_args(fn)}")
+        doc = inspect.getdoc(fn)
+        if doc is not None:
+            for line in doc.rstrip('\n ').split('\n'):
+                print('    ', line, sep='')
+        print()
+
+Commands = {
+    "current": current,
+    "agenda": agenda,
+    "passed": passed,
+    "failed": failed,
+    "minutes": minutes,
+    "start": start,
+    "next": next,
+    "pass": pass_,
+    "fail": fail,
+    "amend": amend,
+    "new": new,
+    "commands": commands,
+}
+
+def getargs(fn):
+    r'''Yields arg, kind.
+
+    Where kind is 'option', 'required', 'list' or a default value
+
+    If arg starts with '_', all '_' have been replaced with '-', leaving the initial '-'.
+
+    This looks at fn.__code__ directly, rather than importing inspect.
+    '''
+    code = fn.__code__
+    fn_args = code.co_varnames[:code.co_argcount]
+    fn_defaults = fn.__defaults__ or ()
+    num_no_defaults = len(fn_args) - len(fn_defaults)
+    for arg in fn_args[: num_no_defaults]:
+        if arg[0] == '_':
+            yield '-' + arg.replace('_', '-'), 'option'
+        elif arg[-1] == '_':
+            yield arg, 'list'
+        else:
+            yield arg, 'required'
+    for arg, default in zip(fn_args[num_no_defaults:], fn_defaults):
+        yield arg, default
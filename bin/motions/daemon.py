@@ -0,0 +1,113 @@
+# daemon.py
+
+r'''The resident mode for the motion commands.
+
+Started with:
+
+    motions-daemon &
+
+this keeps the commands and each meeting's Motion_index loaded, so the commands only have to
+connect to it, rather than start up and load everything each time.
+
+Each connection sends one json line: {"argv": [command, args...], "cwd": directory, "env":
+{name: value}}, and gets back one json line: {"stdout": str, "stderr": str, "status": exit
+status, "edit": path or null}.  The client prints stdout and stderr, and runs the editor on edit
+(if it's not null).  Commands are run one at a time, in the client's directory, with the client's
+values of the variables in push.Environ.
+'''
+
+import os
+import io
+import sys
+import json
+import socket
+import traceback
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+
+from . import commands
+from .cli import run
+from .push import Environ
+
+
+@contextmanager
+def client_environ(env):
+    r'''Sets the variables in Environ as they are in env (a dict) for the with statement.
+
+    Those not in env are unset, so the daemon's own values aren't used by mistake.
+    '''
+    saved = {var: os.environ.get(var) for var in Environ}
+    try:
+        for var in Environ:
+            if var in env:
+                os.environ[var] = env[var]
+            else:
+                os.environ.pop(var, None)
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+def handle(conn):
+    r'''Runs the command sent on conn and sends back the reply.
+    '''
+    with conn, conn.makefile('rwb') as f:
+        request = json.loads(f.readline())
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        status = 0
+        edit = None
+        try:
+            os.chdir(request['cwd'])
+            with redirect_stdout(stdout), redirect_stderr(stderr), \
+                 client_environ(request.get('env', {})):
+                commands.index().refresh()    # in case it was changed outside of the commands
+                edit = run(request['argv'][0], request['argv'][1:])
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                print(e.code, file=stderr)
+                status = 1
+        except Exception:
+            traceback.print_exc(file=stderr)
+            status = 1
+        reply = {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'status': status,
+                 'edit': None if edit is None else str(edit)}
+        f.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+def serve(path):
+    r'''Runs commands sent to the Unix socket at path, until interrupted.
+    '''
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            print(f"ERROR: the motions daemon is already running on {path}", file=sys.stderr)
+            sys.exit(1)
+        except ConnectionRefusedError:
+            os.unlink(path)       # left over from a daemon that's gone
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)   # just for this user
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(old_umask)
+    sock.listen()
+    print("motions daemon listening on", path)
+    try:
+        while True:
+            conn, _ = sock.accept()
+            try:
+                handle(conn)
+            except (OSError, ValueError) as e:
+                print("motions daemon: bad request:", e, file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        os.unlink(path)
@@ -0,0 +1,274 @@
+# ids.py
+
+r'''Motion names, parsed once.
+
+A motion name is a base, which is the parts of the motion and its amendments separated by '-',
+optionally followed by a '.' version (the motion as amended by its passed amendments):
+
+    >>> id = Motion_id('mot-1-2.3')
+    >>> id.parts, id.version
+    (('mot', '1', '2'), (3,))
+    >>> id.base
+    'mot-1-2'
+
+Motion_ids are interned, so parsing the same name again just returns the same Motion_id.
+
+A Motion_trie holds a set of motions by their parts, to answer "is this motion subordinate to
+any of these", "what is the latest version of this motion" and "what is the next amendment number
+for this motion" by walking down from the root, rather than looking at every motion.
+'''
+
+import re
+import sys
+
+
+class Motion_id:
+    r'''The parsed motion name.
+
+    parts is the base of the name split on '-', version are the numbers after the '.'s and
+    sort_key sorts the motions in the order that they were made.  sort_key is the tuple key for
+    the name, parsed once, since the Motion_id is interned.
+    '''
+    __slots__ = ('name', 'parts', 'version', 'sort_key')
+
+    Interned = {}     # name: Motion_id
+
+    def __new__(cls, name):
+        name = str(name)
+        id = cls.Interned.get(name)
+        if id is not None:
+            return id
+        id = super().__new__(cls)
+        id.name = sys.intern(name)
+        base, *version = name.split('.')
+        id.parts = tuple(sys.intern(part) for part in base.split('-'))
+        id.version = tuple(int(v) if v.isdigit() else v for v in version)
+        id.sort_key = sort_key(name)
+        cls.Interned[name] = id
+        return id
+
+    def __repr__(self):
+        return f"Motion_id({self.name!r})"
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def base(self):
+        r'''The name without its .X version.
+        '''
+        return '-'.join(self.parts)
+
+    @property
+    def depth(self):
+        r'''0 for a main motion, 1 for a primary amendment, 2 for a secondary amendment.
+        '''
+        return len(self.parts) - 1
+
+    def subordinate_to(self, b):
+        r'''True if this motion is subordinate to motion b.
+
+        For example, mot-1-1 and mot-1.1 are subordinate to mot, mot-1 and mot-1.2, but not
+        mot-2.
+
+        >>> def subordinate_to(a, b): return Motion_id(a).subordinate_to(Motion_id(b))
+        >>> subordinate_to('mot-1-1', 'mot')
+        True
+        >>> subordinate_to('mot-1-1', 'mot.2')
+        True
+        >>> subordinate_to('mot-1-1', 'mot.2.3')
+        True
+        >>> subordinate_to('mot-1-1', 'mot-1')
+        True
+        >>> subordinate_to('mot-1-1', 'mot-1.2')
+        True
+        >>> subordinate_to('mot-1-1', 'mot-1-1')
+        True
+        >>> subordinate_to('mot-1-1', 'mot-2')
+        False
+        >>> subordinate_to('mot-1.1', 'mot')
+        True
+        >>> subordinate_to('mot-1.1', 'mot.2')
+        True
+        >>> subordinate_to('mot-1.1', 'mot.2.3')
+        True
+        >>> subordinate_to('mot-1.1', 'mot-1')
+        True
+        >>> subordinate_to('mot-1.1', 'mot-1.2')
+        True
+        >>> subordinate_to('mot-1.1', 'mot-1-1')
+        False
+        >>> subordinate_to('mot-1.1', 'mot-2')
+        False
+        >>> subordinate_to('mot-1', 'mot')
+        True
+        >>> subordinate_to('mot-1', 'mot.2')
+        True
+        >>> subordinate_to('mot-1', 'mot.2.3')
+        True
+        >>> subordinate_to('mot-1', 'mot-1')
+        True
+        >>> subordinate_to('mot-1', 'mot-1.2')
+        True
+        >>> subordinate_to('mot-1', 'mot-1-1')
+        False
+        >>> subordinate_to('mot-1', 'mot-2')
+        False
+        >>> subordinate_to('mot.1', 'mot')
+        True
+        >>> subordinate_to('mot.1.2', 'mot')
+        True
+        >>> subordinate_to('mot.1', 'mot.2')
+        True
+        >>> subordinate_to('mot.1.2', 'mot.2')
+        True
+        >>> subordinate_to('mot.1', 'mot.2.3')
+        True
+        >>> subordinate_to('mot.1.2', 'mot.2.3')
+        True
+        >>> subordinate_to('mot.1', 'mot-1')
+        False
+        >>> subordinate_to('mot.1.1', 'mot-1')
+        False
+        >>> subordinate_to('mot.1', 'mot-1.2')
+        False
+        >>> subordinate_to('mot.1', 'mot-1-1')
+        False
+        >>> subordinate_to('mot.1', 'mot-2')
+        False
+        >>> subordinate_to('foo', 'foobar')
+        False
+        >>> subordinate_to('foobar', 'foo')
+        False
+        '''
+        return self.parts[:len(b.parts)] == b.parts
+
+
+Number_re = re.compile(r'([-.][0-9]+)')
+
+def sort_key(name):
+    r'''Expands motion name into its parts for sorting.
+
+    'motion-1.2' expands to ['motion', 1, '-', 2, '.'] so that numbers sort properly,
+    also so that -2 and .2 sort together, for example to get motion-2, motion.2 and motion-3;
+    rather than motion-2, motion-3, motion.2.
+
+    >>> sorted(['motion-3', 'motion.2', 'motion-2', 'motion-10'], key=sort_key)
+    ['motion-2', 'motion.2', 'motion-3', 'motion-10']
+    '''
+    def parts():
+        for part in Number_re.split(name):
+            if part:
+                if part[0] in '.-':
+                    yield int(part[1:])
+                    yield part[0]
+                else:
+                    yield part
+    return tuple(parts())
+
+
+class Node:
+    r'''One base in a Motion_trie.
+
+    ids are the Motion_ids in the trie with this base (the base itself and its versions),
+    max_number is the highest amendment or version number under this base.
+    '''
+    __slots__ = ('children', 'ids', 'max_number')
+
+    def __init__(self):
+        self.children = {}    # part: Node
+        self.ids = set()
+        self.max_number = 0
+
+
+class Motion_trie:
+    r'''A set of motions, by their parts.
+
+    >>> trie = Motion_trie(['mot', 'mot-1', 'mot-1-1', 'mot-1.1', 'mot-2', 'mot.1', 'other'])
+    >>> trie.covers('mot-1-1.2'), trie.covers('foo'), Motion_trie(['mot-1']).covers('mot-2')
+    (True, False, False)
+    >>> trie.latest('mot'), trie.latest('mot', exclude=Motion_trie(['mot-2']))
+    (Motion_id('mot-2'), Motion_id('mot.1'))
+    >>> trie.next_number('mot'), trie.next_number('mot-1'), trie.next_number('other')
+    (3, 2, 1)
+    '''
+    def __init__(self, names=()):
+        self.root = Node()
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        id = Motion_id(name)
+        node = self.root
+        for part in id.parts:
+            if part.isdigit():
+                node.max_number = max(node.max_number, int(part))
+            node = node.children.setdefault(part, Node())
+        if id.version and isinstance(id.version[0], int):
+            node.max_number = max(node.max_number, id.version[0])
+        node.ids.add(id)
+
+    def node(self, name):
+        r'''Returns the Node for the base of name, or None.
+        '''
+        node = self.root
+        for part in Motion_id(name).parts:
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def covers(self, name):
+        r'''True if name is subordinate_to any motion in the trie.
+        '''
+        node = self.root
+        for part in Motion_id(name).parts:
+            node = node.children.get(part)
+            if node is None:
+                return False
+            if node.ids:
+                return True
+        return False
+
+    def descendants(self, name, exclude=None):
+        r'''Yields the Motion_ids under the base of name: its versions, amendments, their
+        versions, etc (but not name itself).
+
+        These are the names matching name + '[-.]*'.  Motions covered by exclude (another
+        Motion_trie) are skipped.
+        '''
+        name = Motion_id(name)
+        start = self.node(name)
+        if start is None or exclude is not None and exclude.covers(name):
+            return
+        if name.version:      # just the versions that follow from this one
+            for id in start.ids:
+                if len(id.version) > len(name.version) \
+                   and id.version[:len(name.version)] == name.version:
+                    yield id
+            return
+        stack = [(start, exclude.node(name) if exclude is not None else None)]
+        while stack:
+            node, excluded = stack.pop()
+            if excluded is not None and excluded.ids:
+                continue
+            for id in node.ids:
+                if id is not name:
+                    yield id
+            for part, child in node.children.items():
+                stack.append((child, None if excluded is None else excluded.children.get(part)))
+
+    def latest(self, name, exclude=None):
+        r'''Returns the latest version of name: the last of it and its descendants (skipping
+        those covered by exclude) in sort_key order.
+        '''
+        return max(self.descendants(name, exclude), key=lambda id: id.sort_key,
+                   default=Motion_id(name))
+
+    def next_number(self, name):
+        r'''Returns the next amendment number for name.
+
+        This is one more than the highest amendment or version number already used under name.
+        '''
+        node = self.node(name)
+        return (0 if node is None else node.max_number) + 1
@@ -0,0 +1,182 @@
+# index.py
+
+r'''A persistent index of the motions in a meeting directory, for the agenda commands.
+
+The index is kept in metadata/index.json.  It has the names of all of the motion files and the
+contents of metadata/agenda, metadata/passed and metadata/failed.  When it's loaded, these go into
+Motion_tries, so that a motion's amendments and versions, and whether it (or what it amends) has
+passed or failed, are found without looking at the other motions.
+
+Each command updates the index as it adds files or appends to passed and failed.  If anything is
+changed outside of the commands (metadata edited by hand, files added or removed), the stamps
+(mtimes and sizes) no longer match and the index is rebuilt from the files.
+'''
+
+import os
+import json
+from bisect import bisect_left
+from pathlib import Path
+
+from .ids import Motion_trie
+
+
+Metadata_files = ('agenda', 'passed', 'failed')
+
+
+def read_list(path):
+    r'''Returns the first word on each line of path as a list.
+
+    Lines starting with '#' are ignored.
+    '''
+    if not path.exists(): return []
+    with path.open() as f:
+        return [line.split()[0]
+                for line in f
+                if line[0] != '#']
+
+
+class Motion_index:
+    r'''The motion names, agenda and status for the meeting in motiondir.
+
+    names is a sorted list of the motion filenames, and motions is a Motion_trie of them.  agenda,
+    passed and failed are the lists from those metadata files, closed has a Motion_trie for
+    passed and failed.
+    '''
+    def __init__(self, metadata=Path('metadata'), motiondir=Path('.')):
+        self.metadata = metadata
+        self.motiondir = motiondir
+        self.path = metadata / 'index.json'
+        self.names = []
+        self.agenda = []
+        self.passed = []
+        self.failed = []
+        self.stamps = None
+        self.load()
+
+    def get_stamps(self):
+        r'''Returns what the index was built from: the mtime and size of each metadata file, and
+        the mtime of motiondir (which changes when files are added or removed).
+        '''
+        stamps = {}
+        for filename in Metadata_files:
+            try:
+                stat = (self.metadata / filename).stat()
+                stamps[filename] = [stat.st_mtime_ns, stat.st_size]
+            except FileNotFoundError:
+                stamps[filename] = None
+        stamps['motiondir'] = self.motiondir.stat().st_mtime_ns
+        return stamps
+
+    def load(self):
+        r'''Loads the index from self.path, or rebuilds it if it's missing or out of date.
+        '''
+        stamps = self.get_stamps()
+        try:
+            with self.path.open() as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            saved = None
+        if saved is None or saved['stamps'] != stamps:
+            self.rebuild(stamps)
+        else:
+            self.names = saved['names']
+            self.agenda = saved['agenda']
+            self.passed = saved['passed']
+            self.failed = saved['failed']
+            self.stamps = stamps
+        self.build_tries()
+
+    def refresh(self):
+        r'''Reloads the index if anything has changed since it was loaded.
+        '''
+        if self.get_stamps() != self.stamps:
+            self.load()
+
+    def rebuild(self, stamps):
+        self.names = sorted(entry.name
+                            for entry in os.scandir(self.motiondir)
+                            if entry.name[0] != '.' and entry.is_file())
+        self.agenda = read_list(self.metadata / 'agenda')
+        self.passed = read_list(self.metadata / 'passed')
+        self.failed = read_list(self.metadata / 'failed')
+        self.stamps = stamps
+        self.save()
+
+    def build_tries(self):
+        self.motions = Motion_trie(self.names)
+        self.closed = {'passed': Motion_trie(self.passed), 'failed': Motion_trie(self.failed)}
+
+    def save(self):
+        r'''Writes the index to self.path, if there's a metadata directory to put it in.
+        '''
+        if not self.metadata.is_dir():
+            return
+        import tempfile       # only needed when something has changed
+
+        fd, temp = tempfile.mkstemp(dir=self.metadata, prefix='.index-')
+        with os.fdopen(fd, 'wt') as f:
+            json.dump({'stamps': self.stamps, 'names': self.names, 'agenda': self.agenda,
+                       'passed': self.passed, 'failed': self.failed},
+                      f)
+        os.replace(temp, self.path)
+
+    def in_status(self, name, status):
+        r'''True if name is subordinate_to any motion in status ('passed' or 'failed').
+        '''
+        return self.closed[status].covers(name)
+
+    def remaining(self):
+        r'''Yields the latest version of each motion on the agenda that hasn't passed or failed, in
+        agenda order.
+        '''
+        for motion in self.agenda:
+            if not self.in_status(motion, 'failed') and not self.in_status(motion, 'passed'):
+                yield self.latest(motion)
+
+    def with_prefix(self, prefix):
+        r'''Returns the names starting with prefix, in sorted order.
+        '''
+        i = bisect_left(self.names, prefix)
+        ans = []
+        while i < len(self.names) and self.names[i].startswith(prefix):
+            ans.append(self.names[i])
+            i += 1
+        return ans
+
+    def family(self, motion):
+        r'''Returns all of the amendments and versions of motion (but not motion itself).
+
+        These are the names matching motion + '[-.]*', in the order they were made.
+        '''
+        return [id.name for id in sorted(self.motions.descendants(motion),
+                                         key=lambda id: id.sort_key)]
+
+    def latest(self, motion):
+        r'''Returns the name of the latest version of motion, skipping failed amendments.
+        '''
+        return self.motions.latest(motion, exclude=self.closed['failed']).name
+
+    def next_number(self, motion):
+        r'''Returns the number for the next amendment to motion.
+        '''
+        return self.motions.next_number(motion)
+
+    def added(self, name):
+        r'''Records that the motion file name exists (it's fine if it already did).
+        '''
+        name = str(name)
+        i = bisect_left(self.names, name)
+        if i == len(self.names) or self.names[i] != name:
+            self.names.insert(i, name)
+            self.motions.add(name)
+        self.stamps = self.get_stamps()
+        self.save()
+
+    def appended(self, status, motion):
+        r'''Records that motion was appended to metadata/<status>.
+        '''
+        getattr(self, status).append(str(motion))
+        if status in self.closed:
+            self.closed[status].add(motion)
+        self.stamps = self.get_stamps()
+        self.save()
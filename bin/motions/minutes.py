@@ -0,0 +1,121 @@
+# minutes.py
+
+r'''Exports the minutes: the final wording of each motion that passed, and the redline of each
+amendment to it that passed (from amendments.apply), as one html file.
+
+Each motion file is rendered through the same markdown setup as watcher.py (render.py).  The
+html is cached in metadata/rendered under the sha1 of the file's contents, so exporting again
+only renders the files that changed.  The files that do need rendering are spread over a
+process pool, since markdown is slow on long documents like bylaws.
+'''
+
+import os
+import sys
+import hashlib
+from html import escape
+from pathlib import Path
+
+from .push import Source_dir
+
+
+Page = '''<!DOCTYPE html>
+<html>
+   <head>
+      <meta charset="utf-8">
+      <title>{title}</title>
+      <style>
+         del {{ color: red; }}
+         ins {{ color: green; }}
+         section {{ margin-bottom: 2em; }}
+         .redline {{ white-space: pre-wrap; }}
+      </style>
+   </head>
+   <body>
+      <h1>{title}</h1>
+{sections}
+   </body>
+</html>
+'''
+
+Section = '''      <section id="{id}">
+         <h2>{name}</h2>
+{html}{amendments}
+      </section>'''
+
+Amendment = '''
+         <details>
+            <summary>Amendment {name}, passed</summary>
+{redline}
+         </details>'''
+
+
+def load_renderer():
+    r'''Returns render.renderer.
+
+    render takes most of a second to load, so it's only loaded when something needs rendering,
+    and before the pool starts, so that forked workers don't each load it again.
+    '''
+    if Source_dir not in sys.path:
+        sys.path.append(Source_dir)
+    from render import renderer
+    return renderer
+
+def render_text(text):
+    r'''Renders markdown text to html, in a pool worker (or here).
+    '''
+    return load_renderer().convert(text)
+
+def render_all(paths, cache_dir, workers=None):
+    r'''Returns the html for each of paths (Paths of motion files), in the same order.
+
+    Rendered html is cached in cache_dir by content.  The rest are rendered by a pool of
+    worker processes (one per cpu by default).  Returns html, rendered, where rendered is the
+    number that weren't in the cache.
+    '''
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    texts = [path.read_text() for path in paths]
+    cache_paths = [cache_dir / (hashlib.sha1(text.encode('utf-8')).hexdigest() + '.html')
+                   for text in texts]
+    html = [None] * len(paths)
+    todo = {}                 # cache path: (text, [index])
+    for i, cache_path in enumerate(cache_paths):
+        if cache_path.exists():
+            html[i] = cache_path.read_text()
+        else:
+            todo.setdefault(cache_path, (texts[i], []))[1].append(i)
+    if todo:
+        load_renderer()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(todo) > 1 and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rendered = list(pool.map(render_text, [text for text, _ in todo.values()]))
+    else:
+        rendered = [render_text(text) for text, _ in todo.values()]
+    for (cache_path, (_, indexes)), ans in zip(todo.items(), rendered):
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(ans)
+        tmp_path.replace(cache_path)
+        for i in indexes:
+            html[i] = ans
+    return html, len(todo)
+
+def export(motions, output, cache_dir, title, workers=None):
+    r'''Writes the minutes for motions to output.
+
+    motions is a list of (name, Path, amendments) for the passed motions, where amendments is a
+    list of (name, redline html) of the amendments to it that passed.  Returns the number of
+    motions that had to be rendered.
+    '''
+    html, rendered = render_all([path for _, path, _ in motions], cache_dir, workers)
+    sections = '\n'.join(
+                 Section.format(id=escape(str(path)), name=escape(name), html=text,
+                                amendments=''.join(Amendment.format(name=escape(amendment),
+                                                                    redline=redline)
+                                                   for amendment, redline in amendments))
+                 for (name, path, amendments), text in zip(motions, html))
+    tmp_path = Path(str(output) + '.tmp')
+    tmp_path.write_text(Page.format(title=escape(title), sections=sections))
+    tmp_path.replace(output)
+    return rendered
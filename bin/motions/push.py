@@ -0,0 +1,58 @@
+# push.py
+
+r'''Sends a motion straight to meeting.py, so the audience sees it as soon as a command makes it
+the current motion, rather than when watcher.py notices the file change.
+
+Set MEETING_URL to the server's '/change' url ('.../<room>/change' for a room) and MEETING_AUTH
+to its auth key.  If they aren't set, or the server can't be reached, nothing is sent and
+watcher.py posts the file the next time it's saved, as before.  The motions daemon runs each
+command with the client's settings for these (see Environ).
+'''
+
+import os
+import sys
+
+
+Source_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+Environ = ('MEETING_URL', 'MEETING_AUTH')    # the client's, sent to the daemon for each command
+
+
+def push(path, timeout=2):
+    r'''Converts the motion file at path to html and puts it to MEETING_URL.
+
+    Returns True if the server took it.
+    '''
+    url = os.environ.get('MEETING_URL')
+    auth = os.environ.get('MEETING_AUTH')
+    if not url or not auth:
+        return False
+
+    # only imported when there's somewhere to push to, they're slow to load
+    from urllib.parse import urlsplit, urlencode
+    import http.client
+    if Source_dir not in sys.path:
+        sys.path.append(Source_dir)
+    from render import convert
+
+    html = convert(path)
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' \
+                       else http.client.HTTPConnection
+    conn = connection_class(parts.netloc, timeout=timeout)
+    target = f"{parts.path}?{urlencode({'filename': os.path.basename(str(path))})}"
+    try:
+        conn.request('PUT', target, body=html.encode('utf-8'),
+                     headers={'content-type': 'text/html: charset=utf-8',
+                              'Authorization': auth})
+        status = conn.getresponse().status
+    except (OSError, http.client.HTTPException) as e:
+        print(f"push: couldn't reach {url}: {e}, leaving it to the watcher", file=sys.stderr)
+        return False
+    finally:
+        conn.close()
+    if status != 200:
+        print(f"push: {url} returned {status}, leaving it to the watcher", file=sys.stderr)
+        return False
+    print("pushed", str(path))
+    return True
@@ -0,0 +1,133 @@
+# test_ids.py
+
+r'''Checks ids.py: its doctests, and Motion_trie, Motion_id and sort_key against the string based code the
+commands used before them (kept here as old_*), on a generated meeting directory.
+
+Run with pytest, or on its own (from bin: python -m motions.test_ids).
+'''
+
+import re
+import random
+import doctest
+import tempfile
+from pathlib import Path
+from itertools import filterfalse
+
+from motions import ids
+from motions.ids import Motion_id, Motion_trie, sort_key
+
+
+# The commands before ids.py:
+
+def old_subordinate_to(a, b):
+    a = str(a).split('.')[0]  # strip .X
+    b = str(b).split('.')[0]  # strip .X
+    return a == b or a.startswith(b + '-')
+
+def old_in_list(name, motions):
+    for motion in motions:
+        if old_subordinate_to(name, motion):
+            return True
+    return False
+
+old_number_re = re.compile(r'([-.][0-9]+)')
+
+def old_expand(name):
+    def parts():
+        for part in old_number_re.split(str(name)):
+            if part:
+                if part[0] in '.-':
+                    yield int(part[1:])
+                    yield part[0]
+                else:
+                    yield part
+    return tuple(parts())
+
+def old_motion_history(motiondir, motion, failed=()):
+    return [Path(motion)] + sorted(filterfalse(lambda path: old_in_list(path.name, failed),
+                                               motiondir.glob(motion + '[-.]*')),
+                                   key=lambda path: old_expand(path.name))
+
+def old_next_number(motiondir, motion):
+    return max((int(name.name[len(motion) + 1:].split('.')[0].split('-')[0])
+                  for name in motiondir.glob(motion + '[-.]*')),
+               default=0) + 1
+
+
+Bases = ['mot', 'motion', 'foo', 'foobar', 'post_meeting_info']
+
+def motion_names(rand, count):
+    r'''Returns a set of about count motion names, with amendments and versions.
+    '''
+    names = set()
+    while len(names) < count:
+        name = rand.choice(Bases)
+        for _ in range(rand.choice((0, 0, 1, 1, 2))):
+            name += f"-{rand.randint(1, 12)}"
+        for _ in range(rand.choice((0, 0, 0, 1, 2))):
+            name += f".{rand.randint(1, 3)}"
+        names.add(name)
+    return names
+
+def make_meeting(directory, seed, count=400):
+    r'''Creates count motion files in directory, returns their names.
+    '''
+    names = sorted(motion_names(random.Random(seed), count))
+    for name in names:
+        (directory / name).touch()
+    return names
+
+
+def test_doctests():
+    assert doctest.testmod(ids).failed == 0
+
+def test_sort_key():
+    rand = random.Random(1)
+    names = list(motion_names(rand, 500))
+    rand.shuffle(names)
+    assert sorted(names, key=sort_key) == sorted(names, key=old_expand)
+    for name in names:
+        assert sort_key(name) == old_expand(name)
+
+def test_subordinate_to():
+    names = sorted(motion_names(random.Random(2), 150))
+    for a in names:
+        for b in names:
+            assert Motion_id(a).subordinate_to(Motion_id(b)) == old_subordinate_to(a, b), (a, b)
+
+def check_meeting(directory, seed):
+    names = make_meeting(directory, seed)
+    rand = random.Random(seed)
+    trie = Motion_trie(names)
+    candidates = sorted(motion_names(rand, 200) | set(names))
+
+    for size in (1, 5, 20):
+        closed = rand.sample(names, size)
+        closed_trie = Motion_trie(closed)
+        for name in candidates:
+            assert closed_trie.covers(name) == old_in_list(name, closed), (name, closed)
+
+    bases = sorted({name.split('.')[0] for name in candidates})
+    for failed in ([], rand.sample(names, 10), rand.sample(names, 40)):
+        failed_trie = Motion_trie(failed)
+        for base in bases:
+            expected = old_motion_history(directory, base, failed)[-1].name
+            assert trie.latest(base, exclude=failed_trie).name == expected, (base, failed)
+
+    for base in bases:
+        assert trie.next_number(base) == old_next_number(directory, base), base
+
+def test_meeting(tmp_path):
+    for seed in range(5):
+        directory = tmp_path / str(seed)
+        directory.mkdir()
+        check_meeting(directory, seed)
+
+
+if __name__ == "__main__":
+    test_doctests()
+    test_sort_key()
+    test_subordinate_to()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_meeting(Path(tmp))
+    print("ok")
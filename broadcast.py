@@ -0,0 +1,305 @@
+# broadcast.py
+
+r'''Fans out server-sent events to all of the viewers.
+
+Each update is encoded into SSE wire bytes once, by Broadcaster.publish.  Each viewer gets a
+Subscriber with a small latest-wins queue of those bytes, so publishing never waits on a viewer.
+A viewer that falls too far behind skips ahead to the latest snapshot.
+
+Each frame carries an SSE id of the form "<run>.<version>".  When an EventSource reconnects it
+sends that back as the Last-Event-ID header, and gets just the deltas it missed from the replay
+buffer, or a single snapshot if they're no longer there.  The run is the bus's epoch (see
+bus.py), so the ids are the same on every worker, and a viewer can reconnect to any of them.
+
+Between updates the viewers get keepalive comments from aiohttp_sse, which doesn't tell anyone
+when one of those fails.  Broadcaster.reap, run every few seconds, closes the Subscribers whose
+connections have gone or stopped taking data, so their handlers return.
+'''
+
+import os
+import time
+import asyncio
+from collections import deque
+
+import metrics
+
+
+Connects = metrics.Counter('meeting_viewer_connects_total', 'Viewers that have connected.')
+Disconnects = metrics.Counter('meeting_viewer_disconnects_total', 'Viewers that have disconnected.')
+Drops = metrics.Counter('meeting_viewer_drops_total', 'Viewers dropped for stalling.')
+Reaps = metrics.Counter('meeting_viewer_reaps_total',
+                        'Viewers closed between updates because their connection was dead.')
+Skips = metrics.Counter('meeting_viewer_skips_total',
+                        'Times a viewer fell behind and was skipped ahead to a snapshot.')
+Broadcasts = metrics.Counter('meeting_broadcasts_total', 'Updates published.')
+Sent_bytes = metrics.Counter('meeting_sent_bytes_total', 'Bytes written to viewers.')
+Broadcast_bytes = metrics.Histogram('meeting_broadcast_bytes',
+                                    'Bytes queued to all viewers for one update.',
+                                    (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000))
+Fanout_seconds = metrics.Histogram('meeting_fanout_seconds',
+                                   'Time from publishing an update to its last send.',
+                                   (.001, .005, .01, .05, .1, .25, .5, 1, 2.5, 5, 10))
+
+
+def sse_frame(data, event=None, id=None):
+    r'''Returns the SSE wire bytes for one event.
+
+    >>> sse_frame('a\nb', event='snapshot')
+    b'event: snapshot\ndata: a\ndata: b\n\n'
+    '''
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    for line in data.split('\n'):
+        lines.append(f"data: {line}")
+    lines.append('\n')
+    return '\n'.join(lines).encode('utf-8')
+
+
+class Subscriber:
+    r'''One viewer's queue of frames waiting to be sent.
+
+    version is the version of the last frame queued, so the Broadcaster knows whether a delta
+    applies.  sent is the latest version that's been sent (or was current when it subscribed).
+
+    There's one of these per viewer for the whole meeting, so it uses __slots__.
+    '''
+    __slots__ = ('broadcaster', 'name', 'version', 'sent', 'queue', 'ready', 'skips',
+                 'transport', 'stalled_since', 'closed')
+
+    def __init__(self, broadcaster, name, transport=None):
+        self.broadcaster = broadcaster
+        self.name = name
+        self.version = None
+        self.sent = broadcaster.version or 0
+        self.queue = deque()      # (version, frame)
+        self.ready = asyncio.Event()
+        self.skips = 0        # times this subscriber was skipped ahead to a snapshot
+        self.transport = transport
+        self.stalled_since = None # time.monotonic() when transport's buffer was last seen empty
+        self.closed = False
+
+    def offer(self, version, snapshot, delta=None, base=None):
+        r'''Queues the frame for version.  Never blocks.
+
+        The delta is only used if it applies to what this subscriber already has queued and the
+        queue isn't full.  Otherwise everything pending is replaced by the snapshot.
+        '''
+        if delta is not None and self.version == base \
+           and len(self.queue) < self.broadcaster.queue_size:
+            self.queue.append((version, delta))
+        else:
+            if self.queue:
+                self.skips += 1
+                Skips.inc(room=self.broadcaster.name)
+            self.queue.clear()
+            self.queue.append((version, snapshot))
+        self.version = version
+        self.ready.set()
+
+    def close(self):
+        r'''Makes get() return (None, None), so whatever is streaming to this subscriber stops.
+        '''
+        self.closed = True
+        self.ready.set()
+
+    async def get(self):
+        r'''Returns the next (version, frame) to send, waiting for one if necessary.
+
+        Returns (None, None) once the subscriber is closed.
+        '''
+        while not self.queue:
+            if self.closed:
+                return None, None
+            self.ready.clear()
+            await self.ready.wait()
+        return self.queue.popleft()
+
+
+class Broadcaster:
+    r'''Holds the latest snapshot frame and all of the Subscribers.
+
+    queue_size is the most frames a Subscriber may have pending before it's skipped ahead.
+    send_timeout is how long (in seconds) a single write to a viewer may take before the viewer is
+    dropped.
+    replay_size is how many recent deltas are kept for reconnecting viewers.
+    name labels this Broadcaster's metrics.
+    '''
+    def __init__(self, queue_size=4, send_timeout=10, replay_size=32, name=''):
+        self.name = name
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        # so ids from before a restart don't match, until set_run gives the bus's epoch
+        self.run = f"{int(time.time()):x}-{os.getpid():x}"
+        self.version = None
+        self.snapshot = None      # frame bytes
+        self.snapshot_data = None # what's in it
+        self.replay = deque(maxlen=replay_size)   # (version, delta frame or None)
+        self.subscribers = {}     # name: Subscriber
+        self.outstanding = {}     # version: [publish time, subscribers that haven't got it yet]
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def event_id(self, version):
+        return f"{self.run}.{version}"
+
+    def set_run(self, run):
+        r'''Changes the run in the event ids.
+
+        The latest snapshot is encoded again with the new id.  The replay buffer is emptied, since
+        ids from the old run won't be accepted.
+        '''
+        if run == self.run:
+            return
+        self.run = run
+        self.replay.clear()
+        if self.snapshot_data is not None:
+            self.snapshot = sse_frame(self.snapshot_data, event='snapshot',
+                                      id=self.event_id(self.version))
+
+    def parse_event_id(self, event_id):
+        r'''Returns the version in event_id, or None if it isn't from this run.
+        '''
+        run, _, version = (event_id or '').partition('.')
+        if run != self.run or not version.isdigit():
+            return None
+        return int(version)
+
+    def missed(self, version):
+        r'''Returns the delta frames that take a viewer from version to self.version.
+
+        Returns None if they aren't all in the replay buffer, or if a snapshot would be smaller.
+        There may be more of them than queue_size: they're queued all at once by subscribe, and
+        if the viewer hasn't taken them by the next update, offer skips it ahead then.
+        '''
+        if version == self.version:
+            return []
+        if version is None or version > self.version \
+           or not self.replay or self.replay[0][0] > version + 1:
+            return None
+        frames = [(v, frame) for v, frame in self.replay if v > version]
+        if any(frame is None for v, frame in frames) \
+           or sum(len(frame) for v, frame in frames) >= len(self.snapshot):
+            return None
+        return frames
+
+    def subscribe(self, name, last_event_id=None, transport=None):
+        r'''Returns a new Subscriber.
+
+        If last_event_id is given, only the deltas missed since then are queued.  Otherwise (or if
+        they aren't available) the latest snapshot is queued.
+
+        transport is the viewer's connection, for reap.
+        '''
+        sub = Subscriber(self, name, transport)
+        if self.snapshot is not None:
+            frames = self.missed(self.parse_event_id(last_event_id))
+            if frames is None:
+                sub.offer(self.version, self.snapshot)
+            else:
+                sub.queue.extend(frames)
+                sub.version = self.version
+        self.subscribers[name] = sub
+        Connects.inc(room=self.name)
+        return sub
+
+    def unsubscribe(self, sub):
+        if self.subscribers.pop(sub.name, None) is not None:
+            Disconnects.inc(room=self.name)
+            self.delivered(sub, self.version or 0)   # it won't be getting them
+
+    def delivered(self, sub, version):
+        r'''Records that sub has been sent everything up to version.
+
+        When the last subscriber gets an update, the time it took goes into Fanout_seconds.
+        '''
+        if version <= sub.sent:
+            return
+        for v in [v for v in self.outstanding if sub.sent < v <= version]:
+            waiting = self.outstanding[v]
+            waiting[1] -= 1
+            if waiting[1] <= 0:
+                Fanout_seconds.observe(time.perf_counter() - waiting[0], room=self.name)
+                del self.outstanding[v]
+        sub.sent = version
+
+    def publish(self, version, snapshot, delta=None):
+        r'''Encodes snapshot (and optional delta from version - 1) and queues them to all
+        subscribers.
+
+        Returns the number of bytes queued.
+        '''
+        id = self.event_id(version)
+        self.version = version
+        self.snapshot = sse_frame(snapshot, event='snapshot', id=id)
+        self.snapshot_data = snapshot
+        delta_frame = None if delta is None else sse_frame(delta, event='delta', id=id)
+        self.replay.append((version, delta_frame))
+        if self.subscribers:
+            self.outstanding[version] = [time.perf_counter(), len(self.subscribers)]
+        total = 0
+        for sub in self.subscribers.values():
+            sub.offer(version, self.snapshot, delta_frame, version - 1)
+            total += len(sub.queue[-1][1])
+        Broadcasts.inc(room=self.name)
+        Broadcast_bytes.observe(total, room=self.name)
+        return total
+
+    def reap(self, dead_timeout):
+        r'''Closes the subscribers whose connection is gone, or hasn't taken any data (even the
+        keepalives) for dead_timeout seconds.
+
+        Returns the number closed.
+        '''
+        now = time.monotonic()
+        reaped = 0
+        for sub in list(self.subscribers.values()):
+            transport = sub.transport
+            if transport is None or sub.closed:
+                continue
+            if transport.is_closing():
+                dead = True
+            elif transport.get_write_buffer_size():
+                if sub.stalled_since is None:
+                    sub.stalled_since = now
+                dead = now - sub.stalled_since >= dead_timeout
+                if dead:
+                    transport.abort()
+            else:
+                sub.stalled_since = None
+                dead = False
+            if dead:
+                sub.close()
+                Reaps.inc(room=self.name)
+                reaped += 1
+        return reaped
+
+    def close_all(self):
+        r'''Closes all of the subscribers, on shutdown.
+        '''
+        for sub in self.subscribers.values():
+            sub.close()
+
+    def queue_depths(self):
+        r'''Returns the total and the largest number of frames waiting for the subscribers.
+        '''
+        depths = [len(sub.queue) for sub in self.subscribers.values()]
+        return sum(depths), max(depths, default=0)
+
+    async def stream(self, sub, resp):
+        r'''Writes sub's frames to resp until resp disconnects or stalls.
+        '''
+        while resp.is_connected():
+            version, frame = await sub.get()
+            if frame is None or not resp.is_connected():
+                break
+            try:
+                await asyncio.wait_for(resp.write(frame), self.send_timeout)
+            except asyncio.TimeoutError:
+                Drops.inc(room=self.name)
+                raise
+            Sent_bytes.inc(len(frame), room=self.name)
+            self.delivered(sub, version)
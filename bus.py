@@ -0,0 +1,232 @@
+# bus.py
+
+r'''Carries updates between meeting.py workers, so a change PUT to any worker reaches the viewers
+on all of them.
+
+A Bus calls deliver(room, version, filename, contents) for every update published by any worker,
+including this one, in the same order on every worker.  The version is assigned once, where the
+updates are put in order (the hub, for Unix_bus), and carried with the update, so every worker
+has the same version for the same contents.  A worker that joins late is first sent the latest
+update for each room, and updates that aren't newer than what a worker already has are dropped.
+
+The bus also has an epoch, which is the same on every worker for as long as any of them is
+running.  It goes in the viewers' event ids (with the version), so that a viewer can resume on
+any worker, but not after everything has been restarted.
+
+Local_bus is for a single process.  Unix_bus connects the workers on one machine through a Unix
+socket.  To use an external broker, subclass Bus and implement start, publish and close.
+'''
+
+import os
+import json
+import time
+import fcntl
+import random
+import struct
+import asyncio
+
+
+def new_epoch():
+    return f"{int(time.time()):x}-{os.getpid():x}"
+
+
+class Bus:
+    r'''The interface for all of the buses.
+
+    latest has the last update seen for each room, as {room: (version, filename, contents)}.
+    epoch is set by start.
+    '''
+    def __init__(self):
+        self.deliver = None
+        self.set_epoch = None
+        self.epoch = None
+        self.latest = {}
+
+    async def start(self, deliver, set_epoch, latest=None):
+        r'''Starts delivering updates to deliver.
+
+        set_epoch(epoch) is called with the epoch once it's known, and again if it changes.
+        latest has what this worker already has for each room (e.g., from the history), in the
+        same form as self.latest.  Versions carry on from there.
+        '''
+        self.deliver = deliver
+        self.set_epoch = set_epoch
+        if latest:
+            self.latest.update(latest)
+
+    def got_epoch(self, epoch):
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self.set_epoch(epoch)
+
+    async def publish(self, room, filename, contents):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def next_version(self, room):
+        r'''Returns the version for the next update to room.  Only called where they're ordered.
+        '''
+        return self.latest[room][0] + 1 if room in self.latest else 1
+
+    def received(self, room, version, filename, contents):
+        if room in self.latest and version <= self.latest[room][0]:
+            return                # already got it
+        self.latest[room] = version, filename, contents
+        self.deliver(room, version, filename, contents)
+
+
+class Local_bus(Bus):
+    r'''Just delivers straight back to this process.
+    '''
+    async def start(self, deliver, set_epoch, latest=None):
+        await super().start(deliver, set_epoch, latest)
+        self.got_epoch(new_epoch())
+
+    async def publish(self, room, filename, contents):
+        self.received(room, self.next_version(room), filename, contents)
+
+
+def frame(message):
+    data = json.dumps(message).encode('utf-8')
+    return struct.pack('>I', len(data)) + data
+
+async def read_frame(reader):
+    length, = struct.unpack('>I', await reader.readexactly(4))
+    return json.loads(await reader.readexactly(length))
+
+
+class Unix_bus(Bus):
+    r'''Connects the workers through the Unix socket at path.
+
+    The worker holding the lock on path + '.lock' is the hub; the rest connect to it.  Everything
+    published goes through the hub, which gives it its version, sends it to every worker
+    (including the one that published it) and delivers it locally.  Workers send the hub
+    (room, filename, contents), and the hub sends them (room, version, filename, contents).  If
+    the hub goes away, the remaining workers race for the lock to become the new hub, which
+    carries on from the versions and epoch it has.  The hub sends its epoch as the first frame to
+    each worker, as [epoch].
+    '''
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.lock_file = None     # if this is the hub
+        self.server = None        # if this is the hub
+        self.clients = set()      # StreamWriters, if this is the hub
+        self.reader = None        # if this isn't the hub
+        self.writer = None
+        self.listener = None      # Task reading from the hub
+        self.closing = False
+
+    async def start(self, deliver, set_epoch, latest=None):
+        await super().start(deliver, set_epoch, latest)
+        await self.connect()
+
+    async def connect(self):
+        r'''Connects to the hub, or becomes the hub if there isn't one.
+        '''
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+            else:
+                try:
+                    epoch, = await read_frame(self.reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    self.writer.close()       # the hub went away, try again
+                    continue
+                self.got_epoch(epoch)
+                self.listener = asyncio.create_task(self.listen())
+                return
+            lock_file = open(self.path + '.lock', 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:                   # another worker is the hub, or is becoming it
+                lock_file.close()
+                await asyncio.sleep(random.uniform(0.01, 0.1))
+                continue
+            self.lock_file = lock_file
+            if os.path.exists(self.path):
+                os.unlink(self.path)          # left over from a hub that's gone
+            if self.epoch is None:
+                self.got_epoch(new_epoch())
+            self.server = await asyncio.start_unix_server(self.serve, self.path)
+            self.reader = self.writer = None
+            return
+
+    async def listen(self):
+        r'''Delivers updates from the hub, until it goes away.
+        '''
+        try:
+            while True:
+                message = await read_frame(self.reader)
+                self.received(*message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        self.writer.close()
+        self.reader = self.writer = None
+        if not self.closing:
+            await self.connect()
+
+    async def serve(self, reader, writer):
+        r'''Handles one worker connected to the hub.
+        '''
+        writer.write(frame([self.epoch]))
+        for room, (version, filename, contents) in self.latest.items():
+            writer.write(frame((room, version, filename, contents)))
+        self.clients.add(writer)
+        try:
+            while True:
+                message = await read_frame(reader)
+                await self.send_all(*message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def send_all(self, room, filename, contents):
+        r'''Sends an update to every worker, and delivers it here.  Only called on the hub.
+        '''
+        version = self.next_version(room)
+        data = frame((room, version, filename, contents))
+        for writer in self.clients:
+            writer.write(data)
+        self.received(room, version, filename, contents)
+        await asyncio.gather(*(writer.drain() for writer in list(self.clients)),
+                             return_exceptions=True)
+
+    async def publish(self, room, filename, contents):
+        if self.server is not None:
+            await self.send_all(room, filename, contents)
+        elif self.writer is not None:
+            self.writer.write(frame((room, filename, contents)))
+            await self.writer.drain()
+        else:
+            raise ConnectionError("not connected to the bus hub")
+
+    async def close(self):
+        self.closing = True
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.clients):
+                writer.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.lock_file.close()
+        if self.writer is not None:
+            self.writer.close()
+        if self.listener is not None:
+            self.listener.cancel()
+
+
+def make_bus(spec):
+    r'''Returns the Bus for spec, which is 'local' or 'unix:<path>'.
+    '''
+    if spec == 'local':
+        return Local_bus()
+    if spec.startswith('unix:'):
+        return Unix_bus(spec[len('unix:'):])
+    raise ValueError(f"unknown bus {spec!r}")
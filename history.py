@@ -0,0 +1,208 @@
+# history.py
+
+r'''An append-only record, on disk, of every update sent to each room.
+
+The history is a directory with:
+
+    blobs              the html of each update (zlib compressed) and the filenames, one after
+                       another.  Each one is only stored once, however many updates it's in.
+    room-<name>.log    the updates to room <name> ('room-.log' for the room at '/'), one
+                       Record each, oldest first.
+
+Both are only ever appended to, so recording an update costs the same however long the history
+is: at most one new blob and one Record.  They're read through mmap, so update N of a room is just
+a slice at N * Record.size, and the latest state of each room can be loaded straight away on a
+restart.
+
+When several workers share the directory, only the one holding the lock on 'lock' writes to it.
+The others skip writing, and take over if that one goes away.
+'''
+
+import os
+import zlib
+import mmap
+import fcntl
+import struct
+import hashlib
+
+
+# time, version, sha1 of the html, then offset and length in blobs of the html and the filename
+Record = struct.Struct('<dI20sQIQI')
+
+
+class Mapped_file:
+    r'''A file that's appended to, and read through an mmap that's grown as needed.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a+b', buffering=0)
+        self.map = None
+
+    def size(self):
+        return os.fstat(self.file.fileno()).st_size
+
+    def read(self, offset, length):
+        end = offset + length
+        if self.map is None or len(self.map) < end:
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), self.size(), access=mmap.ACCESS_READ)
+        return self.map[offset:end]
+
+    def append(self, data):
+        r'''Writes data at the end of the file, and returns its offset.
+        '''
+        offset = self.size()
+        self.file.write(data)
+        return offset
+
+    def truncate(self, size):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.truncate(size)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+class History:
+    r'''The history in directory.
+    '''
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.blobs = Mapped_file(os.path.join(directory, 'blobs'))
+        self.logs = {}            # room name: Mapped_file
+        self.lock_file = open(os.path.join(directory, 'lock'), 'a')
+        self.writing = False      # True if this process holds the lock
+        self.stored = None        # {sha1 of html: (offset, length)}, see load_stored
+        self.names = None         # {filename: (offset, length)}
+
+    def log_file(self, room):
+        log = self.logs.get(room)
+        if log is None:
+            log = self.logs[room] = Mapped_file(os.path.join(self.directory, f"room-{room}.log"))
+        return log
+
+    def rooms(self):
+        r'''Returns the names of the rooms with a log in the history.
+        '''
+        prefix = 'room-'
+        return [entry[len(prefix):-len('.log')] for entry in os.listdir(self.directory)
+                if entry.startswith(prefix) and entry.endswith('.log')]
+
+    def count(self, room):
+        r'''Returns the number of updates recorded for room.
+        '''
+        return self.log_file(room).size() // Record.size
+
+    def get(self, room, index):
+        r'''Returns update index of room, as a dict without the html.
+        '''
+        time, version, sha1, html_offset, html_length, name_offset, name_length = \
+          Record.unpack(self.log_file(room).read(index * Record.size, Record.size))
+        return {'index': index, 'time': time, 'version': version,
+                'filename': self.blobs.read(name_offset, name_length).decode('utf-8'),
+                'hash': sha1.hex(), 'size': html_length}
+
+    def page(self, room, start, count):
+        r'''Returns updates start to start + count of room (as far as they go), oldest first.
+        '''
+        return [self.get(room, index) for index in range(start, min(start + count,
+                                                                    self.count(room)))]
+
+    def contents(self, room, index):
+        r'''Returns the html of update index of room.
+        '''
+        _, _, _, offset, length, _, _ = \
+          Record.unpack(self.log_file(room).read(index * Record.size, Record.size))
+        return zlib.decompress(self.blobs.read(offset, length)).decode('utf-8')
+
+    def latest(self, room):
+        r'''Returns (version, filename, html) of the last update recorded for room, or None.
+        '''
+        count = self.count(room)
+        if not count:
+            return None
+        update = self.get(room, count - 1)
+        return update['version'], update['filename'], self.contents(room, count - 1)
+
+    def lock(self):
+        r'''Returns True if this process may write, taking the lock if nobody has it.
+        '''
+        if not self.writing:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self.writing = True
+            self.stored = self.names = None   # the last writer may have added some
+        return True
+
+    def load_stored(self):
+        r'''Finds the blobs already stored, from the Records of all of the rooms.
+
+        This reads each Record once, and is only done when this process starts writing.  It also
+        drops anything after the last complete Record, left by a writer that died part way.
+        '''
+        self.stored = {}
+        self.names = {}
+        for room in self.rooms():
+            log = self.log_file(room)
+            size = log.size()
+            if size % Record.size:
+                size -= size % Record.size
+                log.truncate(size)
+            if not size:
+                continue
+            names = set()
+            for _, _, sha1, html_offset, html_length, name_offset, name_length \
+             in Record.iter_unpack(log.read(0, size)):
+                self.stored[sha1] = html_offset, html_length
+                names.add((name_offset, name_length))
+            for offset, length in names:
+                self.names[self.blobs.read(offset, length).decode('utf-8')] = offset, length
+
+    def store_html(self, html):
+        r'''Returns (sha1, offset, length) of html in blobs, storing it if it's new.
+        '''
+        data = html.encode('utf-8')
+        sha1 = hashlib.sha1(data).digest()
+        place = self.stored.get(sha1)
+        if place is None:
+            blob = zlib.compress(data)
+            place = self.stored[sha1] = self.blobs.append(blob), len(blob)
+        return (sha1,) + place
+
+    def store_name(self, filename):
+        r'''Returns (offset, length) of filename in blobs, storing it if it's new.
+        '''
+        place = self.names.get(filename)
+        if place is None:
+            data = filename.encode('utf-8')
+            place = self.names[filename] = self.blobs.append(data), len(data)
+        return place
+
+    def record(self, room, time, version, filename, html):
+        r'''Appends an update to room's log.
+
+        Returns False if another process is the one writing the history.
+        '''
+        if not self.lock():
+            return False
+        if self.stored is None:
+            self.load_stored()
+        sha1, html_offset, html_length = self.store_html(html)
+        name_offset, name_length = self.store_name(filename)
+        self.log_file(room).append(Record.pack(time, version, sha1, html_offset, html_length,
+                                               name_offset, name_length))
+        return True
+
+    def close(self):
+        for log in self.logs.values():
+            log.close()
+        self.blobs.close()
+        self.lock_file.close()
@@ -0,0 +1,206 @@
+# loadtest.py
+
+r'''Load test for meeting.py.
+
+For each number of viewers, starts a fresh meeting.py, connects that many simulated '/viewer'
+clients and PUTs a series of edits to '/change', one paragraph at a time, like an amendment
+being written.  Reports the change-to-receipt latency over all viewers, the server's CPU use and
+its memory per connection, as json:
+
+    python loadtest.py --viewers 100,1000,5000 --output results.json
+
+CPU and memory come from /proc, so are None on systems without it.  The clients all run on one
+event loop, so with thousands of viewers the client side may be what limits the latency.
+'''
+
+import sys
+import os
+import time
+import json
+import random
+import asyncio
+import resource
+import argparse
+import subprocess
+
+import aiohttp
+
+
+Auth = 'loadtest'
+
+Words = ("the bylaws shall be amended by striking inserting members officers committee "
+         "chairman vote quorum meeting motion").split()
+
+def make_document(paragraphs, edit=None):
+    r'''Returns a synthetic html document, with paragraph number edit changed.
+    '''
+    rand = random.Random(paragraphs)
+    paras = [' '.join(rand.choice(Words) for _ in range(40)) for _ in range(paragraphs)]
+    if edit is not None:
+        paras[edit % paragraphs] += f" ++amended {edit}++"
+    return '\n'.join(f"<p>{para}</p>" for para in paras)
+
+
+def proc_stats(pid):
+    r'''Returns (cpu seconds, rss bytes) for process pid, or (None, None) without /proc.
+    '''
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except OSError:
+        return None, None
+    ticks = os.sysconf('SC_CLK_TCK')
+    cpu = (int(fields[11]) + int(fields[12])) / ticks    # utime + stime
+    return cpu, rss_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Viewer:
+    r'''One simulated viewer, recording when each version arrives.
+    '''
+    def __init__(self, num):
+        self.num = num
+        self.received = {}    # version: time
+        self.ready = asyncio.Event()
+
+    async def run(self, session, url):
+        async with session.get(url, params={'fname': f"load{self.num}"}) as resp:
+            version = None
+            async for line in resp.content:
+                if line.startswith(b'id: '):
+                    version = int(line.split(b'.')[-1])
+                elif not line.strip() and version is not None:
+                    self.received[version] = time.perf_counter()
+                    version = None
+                    self.ready.set()
+
+
+async def put(session, url, filename, contents):
+    async with session.put(url, params={'filename': filename},
+                           headers={'content-type': 'text/html: charset=utf-8',
+                                    'Authorization': Auth},
+                           data=contents.encode('utf-8')) as resp:
+        assert resp.status == 200, f"PUT got {resp.status}"
+
+
+async def run_test(args, num_viewers):
+    r'''Runs one test against a fresh meeting.py and returns its results as a dict.
+    '''
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([sys.executable, args.meeting, '-q', '--port', str(args.port), Auth],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=None)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            for _ in range(100):
+                try:
+                    await put(session, base + '/change', 'loadtest', make_document(args.paragraphs))
+                    break
+                except aiohttp.ClientConnectionError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("meeting.py didn't start")
+            _, rss_before = proc_stats(server.pid)
+
+            viewers = [Viewer(i) for i in range(num_viewers)]
+            connecting = asyncio.Semaphore(args.connect_concurrency)
+            async def start(viewer):
+                async with connecting:
+                    task = asyncio.create_task(viewer.run(session, base + '/viewer'))
+                    await viewer.ready.wait()
+                    return task
+            tasks = await asyncio.gather(*(start(viewer) for viewer in viewers))
+            _, rss_after = proc_stats(server.pid)
+
+            cpu_before, _ = proc_stats(server.pid)
+            start_time = time.perf_counter()
+            sent = {}   # version: time
+            for i in range(args.changes):
+                await asyncio.sleep(args.interval)
+                version = i + 2                    # the warm up was version 1
+                sent[version] = time.perf_counter()
+                await put(session, base + '/change', 'loadtest', make_document(args.paragraphs, i))
+            deadline = time.perf_counter() + args.timeout
+            while time.perf_counter() < deadline \
+                  and not all(max(viewer.received) == version for viewer in viewers):
+                await asyncio.sleep(0.1)
+            elapsed = time.perf_counter() - start_time
+            cpu_after, _ = proc_stats(server.pid)
+
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        server.terminate()
+        try:
+            server.wait(5)
+        except subprocess.TimeoutExpired:   # still waiting on viewer handlers to finish
+            server.kill()
+            server.wait()
+
+    latencies = [viewer.received[v] - t
+                 for viewer in viewers
+                 for v, t in sent.items()
+                 if v in viewer.received]
+    missing = [viewer.num for viewer in viewers if max(viewer.received) != version]
+    return {
+        'viewers': num_viewers,
+        'changes': args.changes,
+        'interval': args.interval,
+        'paragraphs': args.paragraphs,
+        'received': len(latencies),
+        'expected': num_viewers * args.changes,
+        'viewers_behind': len(missing),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p99': percentile(latencies, 99),
+        'latency_max': max(latencies, default=None),
+        'server_cpu_percent': None if cpu_before is None
+                              else 100 * (cpu_after - cpu_before) / elapsed,
+        'rss_per_connection': None if rss_before is None
+                              else (rss_after - rss_before) / num_viewers,
+    }
+
+
+async def main(args):
+    results = []
+    for num_viewers in args.viewers:
+        result = await run_test(args, num_viewers)
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+    return results
+
+
+parser = argparse.ArgumentParser(description="load test for meeting.py")
+parser.add_argument('--viewers', '-v', default='100,1000,5000',
+                    type=lambda s: [int(n) for n in s.split(',')],
+                    help='comma separated numbers of viewers to test with')
+parser.add_argument('--changes', '-c', type=int, default=20, help='changes per test')
+parser.add_argument('--interval', '-i', type=float, default=1.0, help='seconds between changes')
+parser.add_argument('--paragraphs', type=int, default=50, help='paragraphs in the document')
+parser.add_argument('--timeout', type=float, default=30,
+                    help='seconds to wait for the last change to reach all viewers')
+parser.add_argument('--connect-concurrency', type=int, default=200)
+parser.add_argument('--port', '-p', type=int, default=8089)
+parser.add_argument('--meeting', default=os.path.join(os.path.dirname(__file__), 'meeting.py'))
+parser.add_argument('--output', '-o', help='write the results (json) here, instead of stdout')
+args = parser.parse_args()
+
+# each viewer takes a file descriptor on both ends
+soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+results = asyncio.run(main(args))
+if args.output:
+    with open(args.output, 'wt') as file:
+        json.dump(results, file, indent=2)
+else:
+    print(json.dumps(results, indent=2))
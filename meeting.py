@@ -1,8 +1,19 @@
 # meeting.py
 
 import sys
+import time
+import atexit
 import asyncio
 import os.path
+import re
+import queue
+import logging
+import logging.handlers
+import json
+import math
+import gzip
+import shutil
+import difflib
 import tempfile
 from pathlib import Path
 import argparse
@@ -10,21 +21,28 @@ import argparse
 from aiohttp import web
 from aiohttp_sse import sse_response
 
+import metrics
+from broadcast import Broadcaster
+from bus import make_bus
+from history import History
+from replay import Replay
+from static_files import Static_files, accepted_encoding, compress
+
 
 # Logging:
 
-class SplitOutput:
-    def __init__(self, a, b):
-        self.a = a
-        self.b = b
+class LogWriter:
+    r'''A file-like object that sends each line written to it to the log.
 
-    def close(self):
-        self.a.close()
-        self.b.close()
+    sys.stdout and sys.stderr are replaced by these, so stray prints and tracebacks end up in the
+    log (and get rotated) too.
+    '''
+    def __init__(self, level):
+        self.level = level
+        self.partial = ''
 
     def flush(self):
-        self.a.flush()
-        self.b.flush()
+        pass
 
     def seekable(self):
         return False
@@ -36,129 +54,471 @@ class SplitOutput:
         return True
 
     def write(self, data):
-        self.a.write(data)
-        self.b.write(data)
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            log(line, level=self.level)
+        return len(data)
+
+
+def gzip_rotator(source, dest):
+    r'''Compresses the log segment at source into dest, for the RotatingFileHandler.
+    '''
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def pid_running(pid):
+    r'''Returns True if pid (a string) is a running process.
+    '''
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
 
+Logger = logging.getLogger('meeting')
 
-def open_log(quiet):
-    global Log_filename, Log_file
+def open_log(quiet, level=logging.INFO, max_bytes=10_000_000, backups=10):
+    r'''Opens the log file and starts the thread that writes the log.
+
+    log() and debug() just put records on a queue; the QueueListener thread does the writes, so
+    logging never holds up the event loop.
+
+    When the log file reaches max_bytes, it's rotated to Log_filename.1.gz (and the older
+    segments to .2.gz, etc), keeping backups old segments.
+    '''
+    global Log_filename
     prefix = 'monitor-'
-    log_fileno, Log_filename = tempfile.mkstemp(prefix=prefix, suffix=".txt", text=True)
+    log_fileno, Log_filename = tempfile.mkstemp(prefix=f"{prefix}{os.getpid()}-", suffix=".txt",
+                                                text=True)
 
-    # Remove old log files
+    # Remove old log files, but not those of other workers that are still running
     tmpdir = Path(os.path.dirname(Log_filename))
     for file in tmpdir.glob(prefix + '*'):
-        if str(file) != Log_filename:
+        if str(file) != Log_filename and not pid_running(file.name[len(prefix):].split('-')[0]):
             #print("log glob got", repr(file))
             file.unlink()
 
-    Log_file = open(log_fileno, 'w+t', buffering=1)  # line buffering
-
-    if quiet:
-        sys.stderr = Log_file
-        sys.stdout = Log_file
-    else:
-        split_output = SplitOutput(sys.stdout, Log_file)
-        sys.stderr = split_output
-        sys.stdout = split_output
+    os.close(log_fileno)
+
+    file_handler = logging.handlers.RotatingFileHandler(Log_filename, maxBytes=max_bytes,
+                                                        backupCount=backups, encoding='utf-8')
+    file_handler.namer = lambda name: name + '.gz'
+    file_handler.rotator = gzip_rotator
+    handlers = [file_handler]
+    if not quiet:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)   # writes out whatever is left in the queue
+    Logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    Logger.setLevel(level)
+    Logger.propagate = False
+
+    sys.stdout = LogWriter(logging.INFO)
+    sys.stderr = LogWriter(logging.WARNING)
 
     log("Log_filename", repr(Log_filename))
 
-def log(*args):
-    print(*args)
-    #print(*args, file=Log_file)
+def log(*args, level=logging.INFO):
+    r'''Logs args, separated by spaces like print.
+    '''
+    if Logger.isEnabledFor(level):
+        Logger.log(level, ' '.join(map(str, args)))
+
+def debug(*args):
+    r'''Logs per-viewer details, which are only wanted with --log-level debug.
+    '''
+    log(*args, level=logging.DEBUG)
+
+
+# Deltas:
+
+def make_delta(old, new):
+    r'''Returns a list of [start, end, lines] replacements that turn old into new.
+
+    Both old and new are split into lines.  Markdown puts each block element on its own line(s), so
+    this is roughly a block-level diff.  The replacements are in ascending order and index old, so
+    they must be applied from last to first.
+    '''
+    old_lines = old.split('\n')
+    new_lines = new.split('\n')
+    sm = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [[i1, i2, new_lines[j1:j2]]
+            for tag, i1, i2, j1, j2 in sm.get_opcodes()
+            if tag != 'equal']
+
+
+# Rooms:
+
+class Room:
+    r'''The state of one meeting.
+
+    All of the Rooms are in app['rooms'], by name.  The room named '' is served at '/', the others
+    at '/<name>/'.  Each room has its own auth key, contents and viewers.
+
+    With a history, every update is recorded in it, and a new Room starts with the last update
+    recorded for it (from before a restart), rather than empty.
+    '''
+    def __init__(self, name, auth, delta=True, history=None):
+        self.name = name
+        self.auth = auth
+        self.delta = delta
+        self.broadcaster = Broadcaster(args.queue_size, args.send_timeout, args.replay_size, name)
+        self.version = 0          # bumped on each change
+        self.new_filename = None
+        self.new_contents = None  # html
+        self.snapshot = None      # json {version, html} for new_contents
+        self.start_key = None     # (run, version, start.html version) that start_pages are for
+        self.start_pages = {}     # {encoding: bytes} of start.html rendered for start_key
+        self.history = history
+        if history is not None:
+            latest = history.latest(name)
+            if latest is not None:
+                self.restore(*latest)
+
+    def restore(self, version, filename, contents):
+        r'''Makes contents (html) the current contents at version, without sending it to anyone.
+        '''
+        self.version = version
+        self.new_filename = filename
+        self.new_contents = contents
+        self.snapshot = json.dumps({'version': self.version, 'html': contents})
+        self.broadcaster.publish(self.version, self.snapshot)
+        log("room", repr(self.name), "restored version", version, filename, "from the history")
+
+    def update(self, version, filename, contents):
+        r'''Makes contents (html) the current contents, at version, and sends it to all of the
+        viewers.
+
+        The version comes from the bus, so it's the same on every worker.  It's only sent as a
+        delta if it follows on from the current version (this worker may have missed some while
+        the bus changed hubs).
+        '''
+        old_contents = self.new_contents
+        old_version = self.version
+        self.version = version
+        self.new_filename = filename
+        self.new_contents = contents
+        self.snapshot = json.dumps({'version': self.version, 'html': contents})
+        delta = None
+        if self.delta and old_contents is not None and old_version == version - 1:
+            delta = json.dumps({'base': old_version, 'version': self.version,
+                                'ops': make_delta(old_contents, contents)})
+            if len(delta) >= len(self.snapshot):
+                delta = None
+        log("room", repr(self.name), "pushing version", self.version,
+            contents[:contents.find('\n')], "... to", len(self.broadcaster),
+            "clients, snapshot len", len(self.snapshot),
+            "delta len", None if delta is None else len(delta))
+        nbytes = self.broadcaster.publish(self.version, self.snapshot, delta)
+        log("room", repr(self.name), filename, "queued", nbytes, "bytes")
+        if self.history is not None:
+            self.history.record(self.name, time.time(), self.version, filename, contents)
+
+
+def get_room(request):
+    r'''Returns the Room named in the request's url.
+
+    Raises HTTPNotFound if there is no such room.
+    '''
+    name = request.match_info.get('room', '')
+    room = request.app['rooms'].get(name)
+    if room is None:
+        raise web.HTTPNotFound(text=f"No meeting named {name!r}")
+    return room
 
 
 # Web pages:
 
 async def init(request):
-    r'''Handles request to '/'.
+    r'''Handles request to '/' and '/<room>/'.
 
     Just sends static/signin.hml.
     '''
-    log("init called")
-    return web.FileResponse(path="static/signin.html")
+    room = get_room(request)
+    debug("init called for room", repr(room.name))
+    return request.app['static'].response(request, 'signin.html')
+
+async def add_slash(request):
+    r'''Handles request to '/<room>', so that relative links in the room's pages work.
+    '''
+    raise web.HTTPFound(request.path + '/')
+
+Start_placeholder = 'data-version="" data-event-id=""><p>The meeting will start soon!</div>'
+Snapshot_placeholder = '<script type="application/json" id="snapshot"></script>'
+
+def render_start(room, template):
+    r'''Returns template (static/start.html) with room's contents and version filled in, as bytes.
+
+    The snapshot json goes in too, since the deltas have to apply to the html exactly as it is
+    here, and the browser's innerHTML is its own rewrite of it.  '<' is escaped in the json so the
+    html in it can't end the script element.
+    '''
+    if room.new_contents is None:
+        return template.encode('utf-8')
+    head, tail = template.split(Start_placeholder)
+    middle, end = tail.split(Snapshot_placeholder)
+    event_id = room.broadcaster.event_id(room.version)
+    return ''.join((head, f'data-version="{room.version}" data-event-id="{event_id}">',
+                    room.new_contents, '</div>', middle,
+                    '<script type="application/json" id="snapshot">',
+                    room.snapshot.replace('<', '\\u003c'), '</script>', end)).encode('utf-8')
 
 async def start(request):
-    r'''Handles request to '/start'.
+    r'''Handles request to '/start' and '/<room>/start'.
 
-    Just sends static/start.hml.
+    Sends static/start.html with the current contents already in it, so the viewer doesn't have
+    to wait for the '/viewer' stream to see them.  The rendered (and compressed) pages are cached
+    until the next change.
     '''
-    log("start called for", request.query['fname'])
-    return web.FileResponse(path="static/start.html")
+    room = get_room(request)
+    debug("start called for", request.query['fname'], "in room", repr(room.name))
+    encoding = accepted_encoding(request)
+    template = request.app['static'].get('start.html')
+    if room.start_key != (room.broadcaster.run, room.version, template.version):
+        room.start_key = room.broadcaster.run, room.version, template.version
+        room.start_pages = {}
+    if encoding not in room.start_pages:
+        if 'identity' not in room.start_pages:
+            room.start_pages['identity'] = render_start(room, template.text())
+        room.start_pages[encoding] = compress(room.start_pages['identity'], encoding)
+        log("start rendered room", repr(room.name), "version", room.version, encoding,
+            "len", len(room.start_pages[encoding]))
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return web.Response(body=room.start_pages[encoding], headers=headers,
+                        content_type='text/html', charset='utf-8')
 
 async def static(request):
     r'''Handles requests to '/static/*'.
 
-    Just sends the file in the source code's static directory.
+    Sends the file in the source code's static directory, from app['static'].
     '''
-    path = os.path.join(Source_dir, 'static', request.match_info['filename'])
-    log("static called with filename", request.match_info['filename'], "path", path)
-    return web.FileResponse(path=path)
+    debug("static called with filename", request.match_info['filename'])
+    return request.app['static'].response(request, request.match_info['filename'])
 
 
 Viewer_num = 1
 
 async def viewer(request: web.Request) -> web.StreamResponse:
-    r'''Handles requests to '/viewer' for server-sent events.
+    r'''Handles requests to '/viewer' and '/<room>/viewer' for server-sent events.
 
-    Each event is simply the html contents of the file that just changed.
+    Sends a 'snapshot' event with the full html (and its version) first, then 'delta' events as
+    the contents change.  A viewer that missed a version gets another 'snapshot' instead.
+
+    The frames come pre-encoded from the room's broadcaster.  A reconnecting EventSource sends the
+    Last-Event-ID header, and only gets what it missed.
+
+    Keepalive comments go out every --keepalive seconds, so proxies don't cut the stream between
+    motions.  The kernel gives up on a connection whose data isn't acknowledged within
+    --dead-timeout seconds (where it supports TCP_USER_TIMEOUT), and reaper() closes it here.
     '''
     global Viewer_num
+    room = get_room(request)
     client_ip = request.remote
     fname = request.query['fname']
     viewer_num = fname, Viewer_num
     Viewer_num += 1
-    log("viewer", viewer_num, "called from", client_ip)
-    app = request.app
-    async with sse_response(request) as resp:
-        contents = getattr(app['globals'], 'new_contents', None)
-
-        # set up my_event
-        my_event = asyncio.Event()
-        app['events'][viewer_num] = my_event
+    debug("viewer", viewer_num, "called from", client_ip, "for room", repr(room.name))
+    broadcaster = room.broadcaster
+    async with sse_response(request, ping_interval=args.keepalive,
+                            send_timeout=args.dead_timeout) as resp:
+        # start.html passes the version it was rendered with as last_event_id, reconnects send the
+        # header
+        last_event_id = request.headers.get('Last-Event-ID', request.query.get('last_event_id'))
+        sub = broadcaster.subscribe(viewer_num, last_event_id, request.transport)
+        if last_event_id is not None:
+            debug("viewer", viewer_num, "resuming from", last_event_id, "with",
+                len(sub.queue), "frames")
         try:
-            while resp.is_connected():
-                if contents is None:  # False the first time through if initial file found
-                    await my_event.wait()
-                    contents = app['globals'].new_contents
-                    my_event.clear()
-                if resp.is_connected():
-                    log("viewer", viewer_num, "got contents", contents[:contents.find('\n')], "...")
-                    await resp.send(contents)
-                    contents = None
+            await broadcaster.stream(sub, resp)
+        except asyncio.TimeoutError:
+            log("viewer", viewer_num, "stalled, dropping it", level=logging.WARNING)
+        except ConnectionError as e:
+            debug("viewer", viewer_num, "lost its connection:", e)
         finally:
-            del app['events'][viewer_num]
-    log("viewer", viewer_num, "done")
+            broadcaster.unsubscribe(sub)
+            if sub.skips:
+                debug("viewer", viewer_num, "skipped ahead", sub.skips, "times")
+    debug("viewer", viewer_num, "done")
     return resp  # ??
 
 
+async def snapshot(request):
+    r'''Handles requests to '/snapshot' and '/<room>/snapshot'.
+
+    Returns the current version and html as json, for viewers that got a delta they can't apply.
+    '''
+    room = get_room(request)
+    debug("snapshot called for room", repr(room.name), "version", room.version)
+    if room.snapshot is None:
+        return web.HTTPNoContent()
+    return web.Response(text=room.snapshot, content_type='application/json')
+
+
+def get_history(request):
+    r'''Returns app['history'].
+
+    Raises HTTPNotFound if the server isn't keeping one.
+    '''
+    history = request.app['history']
+    if history is None:
+        raise web.HTTPNotFound(text="No history kept, see --history")
+    return history
+
+def query_int(request, name, default):
+    try:
+        return int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be a number")
+
+async def history(request):
+    r'''Handles requests to '/history' and '/<room>/history'.
+
+    Returns a page of the room's recorded updates, oldest first, as json:
+
+        {"total": N, "start": S, "updates": [{"index", "time", "version", "filename", "hash",
+                                              "size"}, ...]}
+
+    where size is the compressed size of the html.  Query parameters:
+
+        start=N    the index of the first update, defaults to the last page
+        count=N    the most updates to return, default 50, at most 500
+
+    The html of each update is at '/history/<index>' (or '/<room>/history/<index>').
+    '''
+    room = get_room(request)
+    history = get_history(request)
+    total = history.count(room.name)
+    count = min(max(query_int(request, 'count', 50), 0), 500)
+    start = max(query_int(request, 'start', total - count), 0)
+    debug("history called for room", repr(room.name), "start", start, "count", count)
+    return web.json_response({'total': total, 'start': start,
+                              'updates': history.page(room.name, start, count)})
+
+async def history_update(request):
+    r'''Handles requests to '/history/<index>' and '/<room>/history/<index>'.
+
+    Returns the html of that update.
+    '''
+    room = get_room(request)
+    history = get_history(request)
+    index = int(request.match_info['index'])
+    if index >= history.count(room.name):
+        raise web.HTTPNotFound(text=f"No update {index} in room {room.name!r}")
+    return web.Response(text=history.contents(room.name, index), content_type='text/html')
+
+def get_replay(request):
+    r'''Returns the Room and Replay named in the request's url.
+
+    Raises HTTPNotFound if the room isn't a replay.
+    '''
+    room = get_room(request)
+    replay = request.app['replays'].get(room.name)
+    if replay is None:
+        raise web.HTTPNotFound(text=f"Room {room.name!r} isn't a replay, see --replay")
+    return room, replay
+
+async def replay_status(request):
+    r'''Handles get to '/<room>/replay'.
+
+    Returns the state of the room's replay, see replay_control.
+    '''
+    room, replay = get_replay(request)
+    return web.json_response(replay.status())
+
+async def replay_control(request):
+    r'''Handles put to '/<room>/replay', for rooms started with --replay.
+
+    Needs the room's auth key.  The action query parameter is one of:
+
+        play    plays on from where it is, at speed=N times real time (default 1)
+        pause
+        step    sends the next update now, and pauses
+        seek    sends update index=N now, and pauses
+
+    The updates go out like those PUT to '/change'.  Returns the replay's state as json:
+    {"next": index of the next update, "total", "speed": null when paused, "filename"}.
+    '''
+    room, replay = get_replay(request)
+    if request.headers.get('Authorization') != room.auth:
+        log("replay: unauthorized request for room", repr(room.name), level=logging.WARNING)
+        return web.HTTPUnauthorized()
+    action = request.query.get('action')
+    try:
+        if action == 'play':
+            speed = float(request.query.get('speed', 1))
+            if not (math.isfinite(speed) and speed > 0):
+                raise ValueError("speed must be a positive number")
+            await replay.play(speed)
+        elif action == 'pause':
+            replay.pause()
+        elif action == 'step':
+            await replay.step()
+        elif action == 'seek':
+            await replay.seek(int(request.query['index']))
+        else:
+            raise web.HTTPBadRequest(text=f"unknown action {action!r}")
+    except (ValueError, KeyError, IndexError) as e:
+        raise web.HTTPBadRequest(text=f"replay {action}: {e}")
+    except ConnectionError as e:
+        log("replay: couldn't publish to the bus:", e, level=logging.ERROR)
+        return web.HTTPServiceUnavailable()
+    log("replay", action, "in room", repr(room.name), replay.status())
+    return web.json_response(replay.status())
+
+def replay_publisher(room_name):
+    r'''Returns the publish function for a Replay into room_name.
+    '''
+    async def publish(filename, contents):
+        await app['bus'].publish(room_name, filename, contents)
+    return publish
+
+async def stop_replays(app):
+    for replay in app['replays'].values():
+        replay.pause()
+
+
 async def change(request):
-    r'''Called on 'put' to /change
+    r'''Called on 'put' to /change and /<room>/change
+
+    Body of request is html to post to all clients in the room.
 
-    Body of request is html to post to all clients.
+    A room that doesn't exist yet is created if the request has the server's auth key.
     '''
     filename = request.query['filename']
+    name = request.match_info.get('room', '')
     log()
-    log("change called for", filename)
+    log("change called for", filename, "in room", repr(name))
     app = request.app
-    if request.headers['Authorization'] != app['auth']:
-        print("change: unauthorized request, got", request.headers['Authorization'],
-              "expected", app['auth'])
+    room = app['rooms'].get(name)
+    expected = app['auth'] if room is None else room.auth
+    if request.headers['Authorization'] != expected:
+        log("change: unauthorized request for room", repr(name), level=logging.WARNING)
         return web.HTTPUnauthorized()
     assert request.content_type.startswith('text/html:'), f"got content-type {request.content_type}"
     #assert request.body_exists
     #assert request.can_read_body
     contents = await request.text()
-    if contents:
-        app['globals'].new_filename = filename
-        app['globals'].new_contents = contents
-        log("change pushing", contents[:contents.find('\n')], "... to",
-            len(app['events']), "clients")
-        for ev in app['events'].values():
-            ev.set()
-        #await app['multi_queue'].push(new_filename, new_contents)
-        log("change", filename, "sets done")
+    if room is not None and filename == room.new_filename and contents == room.new_contents:
+        # the motion commands push a motion before the watcher posts the same file
+        log("change", filename, "unchanged, not sent to clients")
+    elif contents:
+        try:
+            await app['bus'].publish(name, filename, contents)
+        except ConnectionError as e:
+            log("change: couldn't publish", filename, "to the bus:", e, level=logging.ERROR)
+            return web.HTTPServiceUnavailable()
     elif filename == 'log':
         log("change", filename, "returning log file!")
         return await get_log(request)
@@ -169,32 +529,179 @@ async def change(request):
     return web.Response()
 
 
+def deliver(room_name, version, filename, contents):
+    r'''Called by the bus for each change, PUT to this worker or any other.
+
+    Creates the room if this worker hasn't seen it yet.
+    '''
+    room = app['rooms'].get(room_name)
+    if room is None:
+        log("creating room", repr(room_name))
+        room = app['rooms'][room_name] = Room(room_name, app['auth'], app['delta'],
+                                              app['history'])
+        room.broadcaster.set_run(app['bus'].epoch)
+    room.update(version, filename, contents)
+
+def set_epoch(epoch):
+    r'''Called by the bus with its epoch, which goes in the viewers' event ids.
+    '''
+    log("bus epoch", epoch)
+    for room in app['rooms'].values():
+        room.broadcaster.set_run(epoch)
+
+async def start_bus(app):
+    r'''Starts the bus, from the versions the rooms were restored to (see Room.restore).
+    '''
+    await app['bus'].start(deliver, set_epoch,
+                           {name: (room.version, room.new_filename, room.new_contents)
+                            for name, room in app['rooms'].items()
+                            if room.new_contents is not None})
+
+async def close_bus(app):
+    await app['bus'].close()
+
+async def close_history(app):
+    if app['history'] is not None:
+        app['history'].close()
+
+
+async def reaper(app):
+    r'''Closes dead viewer connections in all of the rooms, every --keepalive seconds.
+    '''
+    while True:
+        await asyncio.sleep(args.keepalive)
+        for room in list(app['rooms'].values()):
+            reaped = room.broadcaster.reap(args.dead_timeout)
+            if reaped:
+                log("reaped", reaped, "dead viewers in room", repr(room.name))
+
+async def start_reaper(app):
+    app['reaper'] = asyncio.create_task(reaper(app))
+
+async def close_viewers(app):
+    r'''Ends all of the viewer streams on shutdown, rather than waiting for them to time out.
+    '''
+    app['reaper'].cancel()
+    for room in app['rooms'].values():
+        room.broadcaster.close_all()
+
+
+Viewers = metrics.Gauge('meeting_viewers', 'Viewers connected now.')
+Queue_depth = metrics.Gauge('meeting_queue_depth', 'Frames waiting to be sent, over all viewers.')
+Queue_depth_max = metrics.Gauge('meeting_queue_depth_max', 'Most frames waiting for one viewer.')
+
+async def get_metrics(request):
+    r'''Handles requests to '/metrics'.
+
+    Returns the metrics in the Prometheus text format.  The gauges are filled in here, the rest
+    are recorded as things happen.
+    '''
+    for room in request.app['rooms'].values():
+        total, most = room.broadcaster.queue_depths()
+        Viewers.set(len(room.broadcaster), room=room.name)
+        Queue_depth.set(total, room=room.name)
+        Queue_depth_max.set(most, room=room.name)
+    return web.Response(body=metrics.render().encode('utf-8'),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def tail_lines(path, n, chunk_size=65536):
+    r'''Returns the last n lines of the file at path.
+
+    Reads backwards from the end, so only the tail of a big file is read.
+    '''
+    with open(path, 'rb') as file:
+        pos = file.seek(0, os.SEEK_END)
+        data = b''
+        while pos > 0 and data.count(b'\n') <= n:
+            step = min(chunk_size, pos)
+            pos -= step
+            file.seek(pos)
+            data = file.read(step) + data
+    return b''.join(data.splitlines(keepends=True)[-n:]).decode('utf-8', errors='replace')
+
 async def get_log(request):
     r'''Returns current log file contents as download file.
+
+    The file is streamed in chunks and honors Range requests.  Query parameters:
+
+        tail=N     returns just the last N lines, as text
+        segment=N  returns the Nth most recent rotated (gzipped) segment
     '''
     log()
-    log("log called")
-    app = request.app
+    log("log called", dict(request.query))
     #if request.headers['Authorization'] != app['auth']:
     #    print("change: unauthorized request, got", request.headers['Authorization'],
     #          "expected", app['auth'])
     #    return web.HTTPUnauthorized()
-    Log_file.seek(0)
-    text = Log_file.read()
-    filename = os.path.basename(Log_filename)
-    return web.Response(headers={'Content-Disposition': f'attachment; filename={filename}'},
-                        #text=text.encode('utf-8'))
-                        text=text)
+    if 'tail' in request.query:
+        n = query_int(request, 'tail', 0)
+        if n <= 0:
+            raise web.HTTPBadRequest(text="tail must be a positive number")
+        text = await asyncio.get_running_loop().run_in_executor(
+                 None, tail_lines, Log_filename, n)
+        return web.Response(text=text)
+    path = Log_filename
+    if 'segment' in request.query:
+        path = f"{Log_filename}.{query_int(request, 'segment', 0)}.gz"
+        if not os.path.exists(path):
+            raise web.HTTPNotFound(text=f"No log segment {request.query['segment']}")
+    filename = os.path.basename(path)
+    return web.FileResponse(path=path,
+                            headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 
 # Get the show on the road!
 
 parser = argparse.ArgumentParser(description="meeting monitor")
 parser.add_argument('--quiet', '-q', default=False, action='store_true')
-parser.add_argument('auth')
+parser.add_argument('--log-level', '-l', default='info', choices=('debug', 'info', 'warning'),
+                    help="debug logs each viewer's connects and sends")
+parser.add_argument('--log-max-bytes', type=int, default=10_000_000,
+                    help="rotate the log file when it gets this big")
+parser.add_argument('--log-backups', type=int, default=10,
+                    help="number of rotated (gzipped) log segments to keep")
+parser.add_argument('--no-delta', default=False, action='store_true',
+                    help="always send full snapshots to viewers")
+parser.add_argument('--queue-size', type=int, default=4,
+                    help="frames a viewer may fall behind before skipping to a snapshot")
+parser.add_argument('--send-timeout', type=float, default=10,
+                    help="seconds a send to one viewer may take before it's dropped")
+parser.add_argument('--replay-size', type=int, default=32,
+                    help="recent deltas kept for reconnecting viewers")
+parser.add_argument('--keepalive', type=float, default=15,
+                    help="seconds between keepalive comments to idle viewers")
+parser.add_argument('--dead-timeout', type=float, default=60,
+                    help="seconds a viewer may go without taking data before it's closed")
+parser.add_argument('--history', metavar='DIR',
+                    help="record every update in DIR, and start from the last one recorded")
+parser.add_argument('--room', '-r', action='append', default=[], metavar='NAME[:AUTH]',
+                    help="serve a meeting at /NAME/, AUTH defaults to auth")
+parser.add_argument('--replay', action='append', default=[], metavar='NAME=SOURCE',
+                    help="replay a --history directory (or a room-NAME.log in one), or a "
+                         "meeting directory, at /NAME/, controlled by PUTs to /NAME/replay")
+parser.add_argument('--port', '-p', type=int, default=8080)
+parser.add_argument('--bus', default='local', metavar='local|unix:PATH',
+                    help="how changes reach the other workers, e.g. unix:/tmp/meeting.sock")
+parser.add_argument('--reuse-port', default=False, action='store_true',
+                    help="let several workers listen on the same port (use with --bus)")
+parser.add_argument('auth', help="auth key for '/' and for creating new rooms")
 args = parser.parse_args()
 
-open_log(args.quiet)
+Room_name_re = re.compile(r'[\w.-]+')    # as in the /{room} routes below
+
+# the routes at '/' that would hide a room of the same name
+Root_routes = frozenset(('start', 'viewer', 'snapshot', 'history', 'static', 'change', 'log',
+                         'metrics'))
+
+for name in [arg.partition(':')[0] for arg in args.room] \
+          + [arg.partition('=')[0] for arg in args.replay]:
+    if not Room_name_re.fullmatch(name):
+        parser.error(f"room name {name!r} may only have letters, digits, '_', '.' and '-'")
+    if name in Root_routes:
+        parser.error(f"room name {name!r} is taken by /{name}")
+
+open_log(args.quiet, args.log_level.upper(), args.log_max_bytes, args.log_backups)
 
 log("__file__", __file__)
 Source_dir = os.path.dirname(__file__)
@@ -205,20 +712,53 @@ app.add_routes([
   web.get('/', init),
   web.get('/start', start),
   web.get('/viewer', viewer, allow_head=False),
+  web.get('/snapshot', snapshot),
+  web.get('/history', history),
+  web.get(r'/history/{index:\d+}', history_update),
   web.get('/static/{filename}', static),
   web.put('/change', change),
   web.get('/log', get_log, allow_head=False),
+  web.get('/metrics', get_metrics),
+  web.get(r'/{room:[\w.-]+}', add_slash),
+  web.get(r'/{room:[\w.-]+}/', init),
+  web.get(r'/{room:[\w.-]+}/start', start),
+  web.get(r'/{room:[\w.-]+}/viewer', viewer, allow_head=False),
+  web.get(r'/{room:[\w.-]+}/snapshot', snapshot),
+  web.get(r'/{room:[\w.-]+}/history', history),
+  web.get(r'/{room:[\w.-]+}/history/{index:\d+}', history_update),
+  web.put(r'/{room:[\w.-]+}/change', change),
+  web.get(r'/{room:[\w.-]+}/replay', replay_status),
+  web.put(r'/{room:[\w.-]+}/replay', replay_control),
 ])
 
-class Globals:
-    r'''Just a place to store attributes...
-
-    An instance of Globals is stored in app['globals'].
-    '''
-    pass
-
 app['auth'] = args.auth
-app['events'] = {}
-app['globals'] = Globals()
-
-web.run_app(app)
+app['delta'] = not args.no_delta
+app['history'] = None if args.history is None else History(args.history)
+app['rooms'] = {'': Room('', args.auth, app['delta'], app['history'])}
+for room_arg in args.room:
+    name, _, auth = room_arg.partition(':')
+    app['rooms'][name] = Room(name, auth or args.auth, app['delta'], app['history'])
+    log("room", repr(name), "at", f"/{name}/")
+app['replays'] = {}
+for replay_arg in args.replay:
+    name, _, source = replay_arg.partition('=')
+    app['rooms'][name] = Room(name, args.auth, app['delta'])
+    app['replays'][name] = Replay(source, replay_publisher(name))
+    log("replay of", source, "at", f"/{name}/")
+if app['history'] is not None:
+    # the rooms created by PUTs before a restart
+    for name in app['history'].rooms():
+        if name not in app['rooms'] and Room_name_re.fullmatch(name) \
+           and name not in Root_routes:
+            app['rooms'][name] = Room(name, args.auth, app['delta'], app['history'])
+            log("room", repr(name), "at", f"/{name}/", "from the history")
+app['static'] = Static_files(os.path.join(Source_dir, 'static'))
+app['bus'] = make_bus(args.bus)
+app.on_startup.append(start_bus)
+app.on_startup.append(start_reaper)
+app.on_shutdown.append(stop_replays)
+app.on_shutdown.append(close_viewers)
+app.on_cleanup.append(close_bus)
+app.on_cleanup.append(close_history)
+
+web.run_app(app, port=args.port, reuse_port=args.reuse_port or None)
@@ -0,0 +1,100 @@
+# metrics.py
+
+r'''Counters, gauges and histograms, rendered in the Prometheus text format for '/metrics'.
+
+Recording is just adding to a dict entry, so these can be left on during meetings.  Each value
+is kept per set of label values, passed as keyword arguments:
+
+    >>> c = Counter('example_total', 'An example.', register=False)
+    >>> c.inc(room='a'); c.inc(2, room='a')
+    >>> print(c.render())
+    # HELP example_total An example.
+    # TYPE example_total counter
+    example_total{room="a"} 3
+'''
+
+from bisect import bisect_left
+
+
+Registry = []
+
+
+def labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, register=True):
+        self.name = name
+        self.help = help
+        self.values = {}      # labels_key: value
+        if register:
+            Registry.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self):
+        lines = self.header()
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(key)} {value}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = labels_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[labels_key(labels)] = value
+
+
+class Histogram(Metric):
+    r'''Counts observations into buckets (upper bounds, in ascending order).
+    '''
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets, register=True):
+        super().__init__(name, help, register)
+        self.buckets = tuple(buckets)
+        # values is labels_key: [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = labels_key(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self):
+        lines = self.header()
+        for key, counts in sorted(self.values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                lines.append(f"{self.name}_bucket{format_labels(key, [('le', bound)])} {total}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {total}")
+        return '\n'.join(lines)
+
+
+def render():
+    r'''Returns all of the registered metrics in the Prometheus text format.
+    '''
+    return '\n'.join(metric.render() for metric in Registry) + '\n'
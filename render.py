@@ -0,0 +1,261 @@
+# render.py
+
+r'''Converts the motion files from markdown to html.
+
+Used by watcher.py, and by the motion commands in bin to push a motion straight to meeting.py.
+'''
+
+import os
+import re
+import hashlib
+from collections import OrderedDict
+
+import markdown
+from markdown.inlinepatterns import SimpleTextInlineProcessor
+from markdown.blockprocessors import HRProcessor
+from markdown.extensions import Extension
+
+
+# Markdown Setup:
+
+class UnderlineExtension(Extension):
+    def extendMarkdown(self, md):
+        md.inlinePatterns.register(SimpleTextInlineProcessor(NOT_STRONG_RE, md),
+                                   'underline', 75)
+
+NOT_STRONG_RE = r'(_{4,})'
+
+Extensions = [
+  # no list extension     # must indent nested lists more than text
+  #'sane_lists',          # included in markdown package
+                         # must indent nested lists more than text, no blank lines needed
+  'mdx_truly_sane_lists', # pip install mdx_truly_sane_lists, indent nested lists less than text
+
+  #'prependnewline',      # pip install prependnewline, indent nested lists more than text
+  #'mdx_breakless_lists',  # pip install mdx-breakless-lists, indent nested lists more than text
+
+  'citeurl',              # pip install citeurl
+  #'pymdownx.escapeall',  # what do I have to install for this to work?
+  'markdown_del_ins',     # pip install markdown-del-ins ~~del~~ ++ins++
+  UnderlineExtension(),   # override _italics_ and __bold__ to leave 4 or more _ unmolested.
+]
+
+md = markdown.Markdown(extensions=Extensions)
+
+# block_md renders one block at a time.  CiteURL's postprocessor runs last and looks across the
+# whole document (for "id." and repeated links), so it's run once over the joined blocks instead.
+block_md = markdown.Markdown(extensions=Extensions)
+block_md.postprocessors.deregister('CiteURL')
+
+
+# Incremental rendering:
+
+Hr_re = HRProcessor.SEARCH_RE                           # '---' between amendment sections
+Setext_re = re.compile(r'[=-]+[ ]*$')                   # underline for a setext heading
+Continuation_re = re.compile(r'\s|>|[*+-]\s|\d+\.\s')   # blocks that may join the one before
+Full_render_re = re.compile(r'^ {0,3}(<|\[[^\]]+\]:)', re.MULTILINE)  # html or link references
+Complex_re = re.compile(r'\s|>|[*+-]\s|\d+\.\s|#')   # code, quotes, lists and headings
+Spaces_line_re = re.compile(r'(?<=\n) +(?=\n|\Z)')    # a line of just spaces, but the first
+
+def normalize_whitespace(text):
+    r'''Returns text with its line endings, tabs and lines of just whitespace as markdown has them
+    (markdown.preprocessors.NormalizeWhitespace), so split_blocks sees the same lines it does.
+
+    Lines of just whitespace are blank, except for the first line.
+
+    >>> normalize_whitespace('a\r\n \n\tb\n\t\n')
+    'a\n\n    b\n\n'
+    '''
+    text = text.replace('\r\n', '\n').replace('\r', '\n').expandtabs(md.tab_length)
+    return Spaces_line_re.sub('', text)
+
+def split_blocks(text):
+    r'''Splits markdown text into top-level blocks that markdown renders independently.
+
+    Splits at blank lines, unless the next line is indented, a list item or a quote (which may
+    join the block before), and around '---' lines, unless they make a setext heading.
+
+    >>> split_blocks('a\nb\n---\nc\n\nd\n\n1. e\n\n2. f\n\n---\ng\nh\n---\ni')
+    ['a\nb', '---', 'c', 'd\n\n1. e\n\n2. f', '---', 'g\nh', '---', 'i']
+    '''
+    blocks = []
+    lines = []
+    block_len = 0     # lines since markdown would start a new block
+    blank = False
+
+    def split():
+        while lines and not lines[-1].strip(' \t'):
+            del lines[-1]
+        while lines and not lines[0].strip(' \t'):
+            del lines[0]
+        if lines:
+            blocks.append('\n'.join(lines))
+            lines.clear()
+
+    text_lines = text.split('\n')
+    for i, line in enumerate(text_lines):
+        if not line.strip(' \t'):
+            lines.append(line)
+            block_len = 0
+            blank = True
+            continue
+        if block_len == 1 and Setext_re.match(line) or line.startswith('#'):
+            # markdown starts a new block after a heading
+            lines.append(line)
+            block_len = 0
+        elif Hr_re.match(line) and not (block_len == 0 and i + 1 < len(text_lines)
+                                        and Setext_re.match(text_lines[i + 1])):
+            split()
+            blocks.append(line)
+            block_len = 0
+        else:
+            if blank and not Continuation_re.match(line):
+                split()
+            lines.append(line)
+            block_len += 1
+        blank = False
+    split()
+    return blocks
+
+
+def needs_full_render(text):
+    r'''True if text has a '---' (or '___', '***', '===', ...) line that split_blocks can't place.
+
+    That's one right after another, one that's indented, or one in the same paragraph as code, a
+    quote, a list or a heading, where markdown may make it part of those (or a setext heading)
+    instead of a block of its own.  Also text whose first line is just whitespace, which markdown
+    doesn't count as blank (see normalize_whitespace).
+
+    >>> needs_full_render('a\n\n    code\n___\n===')
+    True
+    >>> needs_full_render('- item\n\n    more\n---\n***')
+    True
+    >>> needs_full_render('motion\ntext\n---------\namend the motion by ...')
+    False
+    >>> needs_full_render('    \nmotion')
+    True
+    '''
+    if text[:1] in (' ', '\t') and not text.split('\n', 1)[0].strip(' \t'):
+        return True
+    complex_run = False       # a line since the last blank one was code, a list, etc
+    prev_rule = False
+    for line in text.split('\n'):
+        if not line.strip(' \t'):
+            complex_run = prev_rule = False
+            continue
+        rule = bool(Hr_re.match(line) or Setext_re.match(line))
+        if rule and (complex_run or prev_rule or line[0] in ' \t'):
+            return True
+        if Complex_re.match(line):
+            complex_run = True
+        prev_rule = rule
+    return False
+
+
+class Block_renderer:
+    r'''Renders markdown a block at a time, caching the html for each block.
+
+    The output is the same as md.convert on the whole text, but only the blocks that changed since
+    the last render are converted again.  The cache keeps the cache_size most recently used blocks.
+
+    Each block is also checked for citations on its own.  CiteURL only has to be run over the
+    whole document when some block has one.  Text with raw html or link references falls back to
+    md.convert, since those reach across blocks, as does text that needs_full_render.
+    '''
+    def __init__(self, cache_size=1000):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()   # sha1 of block: (html, has citations)
+        self.hits = 0
+        self.misses = 0
+
+    def render_block(self, block):
+        key = hashlib.sha1(block.encode('utf-8')).digest()
+        ans = self.cache.get(key)
+        if ans is None:
+            self.misses += 1
+            block_md.reset()
+            html = block_md.convert(block)
+            ans = self.cache[key] = html, md.postprocessors['CiteURL'].run(html) != html
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        return ans
+
+    def convert(self, text):
+        text = normalize_whitespace(text)
+        if Full_render_re.search(text) or needs_full_render(text):
+            md.reset()
+            return md.convert(text)
+        parts = []
+        cited = False
+        for block in split_blocks(text):
+            html, has_citations = self.render_block(block)
+            if html:
+                parts.append(html)
+            cited |= has_citations
+        html = '\n'.join(parts)
+        if cited:
+            html = md.postprocessors['CiteURL'].run(html)
+        return html.strip()
+
+renderer = Block_renderer()
+
+
+# Whole files:
+
+class File_cache:
+    r'''The html for the last cache_size files converted, keyed by the sha1 of their contents.
+
+    convert reads the file, and only renders it if its contents changed since it was last
+    converted.  That's what's used for a file that's just been saved, since an edit doesn't always
+    change its mtime or size.  prerender doesn't read a file whose mtime and size are the same as
+    when it was last read, so the watcher can keep the agenda rendered ahead of time cheaply.
+    '''
+    def __init__(self, cache_size=100):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()   # path: ((mtime_ns, size), sha1 of contents, html)
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, path):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            data = file.read()
+        key = stat.st_mtime_ns, stat.st_size
+        sha1 = hashlib.sha1(data).digest()
+        entry = self.cache.get(path)
+        if entry is not None and entry[1] == sha1:
+            self.hits += 1
+            html = entry[2]
+        else:
+            self.misses += 1
+            html = renderer.convert(data.decode('utf-8'))
+        self.cache[path] = key, sha1, html
+        self.cache.move_to_end(path)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return html
+
+    def prerender(self, path):
+        stat = os.stat(path)
+        entry = self.cache.get(path)
+        if entry is not None and entry[0] == (stat.st_mtime_ns, stat.st_size):
+            self.hits += 1
+            self.cache.move_to_end(path)
+            return entry[2]
+        return self.convert(path)
+
+files = File_cache()
+
+def convert(new_path):
+    r'''Convert the markdown contents of new_path to html and return it.
+    '''
+    #log("converting", filename, "from markdown to html")
+    return files.convert(new_path)
+
+def prerender(path):
+    r'''Like convert, but trusts the mtime and size of a file that's been converted before.
+    '''
+    return files.prerender(path)
@@ -0,0 +1,186 @@
+# replay.py
+
+r'''Replays a past meeting to the viewers of a room, for training, or to settle what was on the
+screen when a vote was taken.
+
+The source is either a history recorded with meeting.py --history (its directory, for the room at
+'/', or one of its room-<name>.log files), or a meeting directory of motion files like
+25-02-Leaders.  A meeting directory only has the final version of each file, so those are played
+in the order the meeting took them up (from its metadata), with the gaps between the times they
+were last saved.
+
+Each update is read (or, for a meeting directory, rendered) once, and published like a PUT to
+'/change', so it's encoded once for all of the room's viewers however many there are.
+
+A Replay starts paused, before the first update, and is driven by play (at some multiple of real
+time), pause, step and seek.
+'''
+
+import os
+import re
+import sys
+import asyncio
+from pathlib import Path
+
+from history import History
+
+
+class History_source:
+    r'''The updates to one room in a history.
+
+    path is the history's directory (for the room at '/'), or a room-<name>.log file in it.
+    '''
+    def __init__(self, path):
+        if os.path.isdir(path):
+            directory, room = path, ''
+        else:
+            directory, name = os.path.split(path)
+            room = name[len('room-'):-len('.log')]
+        self.history = History(directory)
+        self.room = room
+        self.updates = self.history.page(room, 0, self.history.count(room))
+
+    def __len__(self):
+        return len(self.updates)
+
+    def html(self, index):
+        return self.history.contents(self.room, index)
+
+
+Motion_re = re.compile(r'[A-Za-z_]\w*(?:[-.]\d+)*')   # mission, mission-1-1, post_meeting_info.2
+
+def meeting_order(path):
+    r'''Returns the names of the motion files in meeting directory path, in the order they were
+    taken up.
+
+    That's each motion on metadata/agenda, followed by its amendments and versions (in sort_key
+    order), then any other motions in metadata/passed or metadata/failed (made during the
+    meeting), the same way.  Scratch files that weren't any of these are left out.  Without a
+    metadata/agenda, it's all of the motion files, in the order they were last modified.
+    '''
+    metadata = Path(path) / 'metadata'
+    if not (metadata / 'agenda').exists():
+        return [name for _, name in sorted((entry.stat().st_mtime, entry.name)
+                                           for entry in os.scandir(path)
+                                           if entry.is_file() and Motion_re.fullmatch(entry.name))]
+    bin_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin')
+    if bin_dir not in sys.path:
+        sys.path.insert(0, bin_dir)
+    from motions.ids import Motion_id
+    from motions.index import Motion_index
+
+    index = Motion_index(metadata, Path(path))
+    order = []
+    seen = set()
+    for motion in index.agenda + index.passed + index.failed:
+        base = Motion_id(motion).base
+        if Motion_id(base).depth or base in seen:
+            continue                  # amendments come with their motion
+        seen.add(base)
+        order.extend(name for name in [base] + index.family(base)
+                     if os.path.isfile(os.path.join(path, name)))
+    return order
+
+class Directory_source:
+    r'''The motion files in a meeting directory, in the order of meeting_order.
+
+    The times are when each was last modified, so gaps between them are played, but an update is
+    never earlier than the one before.  They're all rendered here, since the render is what takes
+    the time.
+    '''
+    def __init__(self, path):
+        from render import convert    # only needed for meeting directories, and slow to load
+
+        self.updates = []
+        time = None
+        for index, name in enumerate(meeting_order(path)):
+            mtime = os.stat(os.path.join(path, name)).st_mtime
+            time = mtime if time is None else max(time, mtime)
+            self.updates.append({'index': index, 'time': time, 'filename': name})
+        self.htmls = [convert(os.path.join(path, update['filename']))
+                      for update in self.updates]
+
+    def __len__(self):
+        return len(self.updates)
+
+    def html(self, index):
+        return self.htmls[index]
+
+def load_source(path):
+    r'''Returns the History_source or Directory_source for path.
+    '''
+    if os.path.exists(os.path.join(path, 'blobs')) or path.endswith('.log'):
+        return History_source(path)
+    return Directory_source(path)
+
+
+class Replay:
+    r'''Plays the updates from source (a path, see load_source) through publish(filename, html),
+    an async function.
+
+    next is the index of the next update to publish.  speed is the multiple of real time it's
+    playing at, or None when it's paused.
+    '''
+    def __init__(self, path, publish):
+        self.path = path
+        self.publish = publish
+        self.source = None        # loaded by the first control
+        self.next = 0
+        self.speed = None
+        self.task = None          # playing this
+
+    async def load(self):
+        if self.source is None:
+            self.source = await asyncio.get_running_loop().run_in_executor(
+                                  None, load_source, self.path)
+
+    def status(self):
+        return {'next': self.next, 'total': None if self.source is None else len(self.source),
+                'speed': self.speed,
+                'filename': self.source.updates[self.next - 1]['filename'] if self.next else None}
+
+    async def send(self, index):
+        r'''Publishes update index.
+        '''
+        self.next = index + 1
+        await self.publish(self.source.updates[index]['filename'], self.source.html(index))
+
+    async def playing(self):
+        updates = self.source.updates
+        while self.next < len(updates):
+            if self.next:
+                gap = updates[self.next]['time'] - updates[self.next - 1]['time']
+                await asyncio.sleep(max(gap, 0) / self.speed)
+            await self.send(self.next)
+        self.speed = None
+
+    async def play(self, speed=1.0):
+        await self.load()
+        self.pause()
+        if self.next >= len(self.source):
+            self.next = 0             # start over
+        self.speed = speed
+        self.task = asyncio.create_task(self.playing())
+
+    def pause(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.speed = None
+
+    async def step(self):
+        r'''Publishes the next update now, and pauses.
+        '''
+        await self.load()
+        self.pause()
+        if self.next < len(self.source):
+            await self.send(self.next)
+
+    async def seek(self, index):
+        r'''Publishes update index now, and pauses.
+        '''
+        await self.load()
+        self.pause()
+        if not 0 <= index < len(self.source):
+            raise IndexError(f"no update {index}, there are {len(self.source)}")
+        await self.send(index)
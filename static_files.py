@@ -0,0 +1,160 @@
+# static_files.py
+
+r'''Serves the files in the static directory from memory.
+
+Each file is read once (and again when it changes on disk), along with its gzip and brotli
+compressed bodies and a strong ETag.  Requests are only ever looked up by name in the loaded
+files, so there's no way to reach outside the static directory.
+
+Links to '/static/<file>' in the html files are fingerprinted with '?v=<version>', so those
+requests can be cached for a long time.  Anything else has to be revalidated with its ETag.
+'''
+
+import os
+import re
+import gzip
+import time
+import hashlib
+import mimetypes
+
+from aiohttp import web
+
+try:
+    import brotli         # pip install brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encoding(request):
+    r'''Returns 'br', 'gzip' or 'identity', whichever is best that the client accepts.
+    '''
+    accept = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and 'br' in accept:
+        return 'br'
+    if 'gzip' in accept:
+        return 'gzip'
+    return 'identity'
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    if encoding == 'gzip':
+        return gzip.compress(body)
+    return body
+
+
+Link_re = re.compile(r'''((?:href|src)=["']/static/)([^"'?#]+)(["'])''')
+
+Long_cache = 'public, max-age=31536000, immutable'
+
+
+class Static_file:
+    r'''One file from the static directory, with its compressed bodies.
+    '''
+    def __init__(self, name, body, stat):
+        self.name = name
+        self.stat = stat.st_mtime_ns, stat.st_size
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.version = hashlib.sha1(body).hexdigest()[:16]
+        self.bodies = {'identity': body}
+        compressible = self.content_type.startswith('text/') \
+                       or self.content_type in ('application/javascript', 'application/json',
+                                                'image/svg+xml')
+        if compressible:
+            for encoding in ('gzip', 'br'):
+                if encoding == 'br' and brotli is None:
+                    continue
+                compressed = compress(body, encoding)
+                if len(compressed) < len(body):
+                    self.bodies[encoding] = compressed
+
+    def etag(self, encoding):
+        if encoding == 'identity':
+            return f'"{self.version}"'
+        return f'"{self.version}-{encoding}"'
+
+    def text(self):
+        return self.bodies['identity'].decode('utf-8')
+
+
+class Static_files:
+    r'''All of the files in directory, by name.
+
+    The directory is checked for changes at most every check_interval seconds.
+    '''
+    def __init__(self, directory, check_interval=2):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.files = {}       # name: Static_file
+        self.checked = 0
+        self.refresh()
+
+    def refresh(self):
+        r'''Reloads any files that have changed since they were loaded.
+
+        The html files are reloaded whenever anything changes, to update their fingerprints.
+        '''
+        self.checked = time.monotonic()
+        stats = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.startswith('.') and entry.is_file():
+                stats[entry.name] = entry.stat()
+        changed = set(self.files) - set(stats)
+        for name in changed:
+            del self.files[name]
+        for name, stat in stats.items():
+            file = self.files.get(name)
+            if file is None or file.stat != (stat.st_mtime_ns, stat.st_size):
+                changed.add(name)
+        if not changed:
+            return
+        html = [name for name in stats if name.endswith('.html')]
+        for name in sorted(stats, key=lambda name: name in html):   # html last
+            if name in changed or name in html:
+                self.load(name, stats[name])
+
+    def load(self, name, stat):
+        with open(os.path.join(self.directory, name), 'rb') as file:
+            body = file.read()
+        if name.endswith('.html'):
+            body = Link_re.sub(self.fingerprint, body.decode('utf-8')).encode('utf-8')
+        self.files[name] = Static_file(name, body, stat)
+
+    def fingerprint(self, match):
+        file = self.files.get(match.group(2))
+        if file is None:
+            return match.group()
+        return f"{match.group(1)}{match.group(2)}?v={file.version}{match.group(3)}"
+
+    def get(self, name):
+        r'''Returns the Static_file for name, or None.
+        '''
+        if time.monotonic() - self.checked > self.check_interval:
+            self.refresh()
+        return self.files.get(name)
+
+    def response(self, request, name):
+        r'''Returns the web.Response for static file name.
+
+        Sends 304 if the client already has it, and a long cache lifetime if the request has
+        the file's current fingerprint.
+        '''
+        file = self.get(name)
+        if file is None:
+            raise web.HTTPNotFound()
+        encoding = accepted_encoding(request)
+        if encoding not in file.bodies:
+            encoding = 'identity'
+        headers = {
+          'ETag': file.etag(encoding),
+          'Vary': 'Accept-Encoding',
+          'Cache-Control': Long_cache if request.query.get('v') == file.version else 'no-cache',
+        }
+        if_none_match = request.headers.get('If-None-Match', '')
+        if any(file.etag(e) in if_none_match for e in file.bodies):
+            return web.Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return web.Response(body=file.bodies[encoding], headers=headers,
+                            content_type=file.content_type,
+                            charset='utf-8' if file.content_type.startswith('text/') else None)
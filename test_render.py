@@ -0,0 +1,71 @@
+# test_render.py
+
+r'''Checks that render.Block_renderer gives the same html as md.convert on the whole text.
+
+Run with pytest, or on its own.
+'''
+
+import glob
+import random
+import doctest
+import os.path
+
+import render
+from render import md, Block_renderer
+
+
+Source_dir = os.path.dirname(os.path.abspath(__file__))
+
+Pieces = ['a', 'b c', '', '', ' ', '    ', '\t', '    code', '  indented', '\t tab', '---', '___', '***', '===',
+          '- - -', '* * *', '   ---', '--', '-', '=', '- item', '* x', '+ plus', '1. one', '2) two',
+          '> quote', '   > q', '# head', '## h2', 'para ~~d~~ ++i++', '<div>x</div>',
+          '[ref]: http://example.com', 'see [ref]', '-----------------']
+
+def full_render(text):
+    md.reset()
+    return md.convert(text)
+
+def differences(texts):
+    return [text for text in texts if Block_renderer().convert(text) != full_render(text)]
+
+def test_doctests():
+    assert doctest.testmod(render).failed == 0
+
+def test_motion_files():
+    paths = [path
+             for pattern in ('25-02-*/*', 'testmeeting/*')
+             for path in glob.glob(os.path.join(Source_dir, pattern))
+             if os.path.isfile(path)]
+    texts = []
+    for path in paths:
+        try:
+            with open(path) as file:
+                texts.append(file.read())
+        except UnicodeDecodeError:
+            pass      # editor swap files
+    assert texts
+    assert differences(texts) == []
+
+def test_random_blocks(count=3000):
+    rand = random.Random(7)
+    texts = ['\n'.join(rand.choice(Pieces) for _ in range(rand.randint(1, 10)))
+             for _ in range(count)]
+    assert differences(texts) == []
+
+def test_edits():
+    r'''Renders a series of edits with one Block_renderer, so its cache is used.
+    '''
+    rand = random.Random(8)
+    renderer = Block_renderer(cache_size=50)
+    lines = [rand.choice(Pieces) for _ in range(40)]
+    for _ in range(300):
+        lines[rand.randrange(len(lines))] = rand.choice(Pieces)
+        text = '\n'.join(lines)
+        assert renderer.convert(text) == full_render(text), text
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith('test_'):
+            fn()
+            print(name, "ok")
@@ -1,46 +1,23 @@
 # watcher.py
 
+import sys
 import os.path
 import argparse
+from urllib.parse import urljoin
+import hashlib
+import threading
+from fnmatch import fnmatchcase
+from pathlib import Path
+from collections import Counter
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 import requests
-import markdown
-from markdown.inlinepatterns import SimpleTextInlineProcessor
-from markdown.extensions import Extension
 
+from render import convert, prerender
 
-# Markdown Setup:
-
-class UnderlineExtension(Extension):
-    def extendMarkdown(self, md):
-        md.inlinePatterns.register(SimpleTextInlineProcessor(NOT_STRONG_RE, md),
-                                   'underline', 75)
-
-NOT_STRONG_RE = r'(_{4,})'
-
-md = markdown.Markdown(extensions=[
-  # no list extension     # must indent nested lists more than text
-  #'sane_lists',          # included in markdown package
-                         # must indent nested lists more than text, no blank lines needed
-  'mdx_truly_sane_lists', # pip install mdx_truly_sane_lists, indent nested lists less than text
-
-  #'prependnewline',      # pip install prependnewline, indent nested lists more than text
-  #'mdx_breakless_lists',  # pip install mdx-breakless-lists, indent nested lists more than text
-
-  'citeurl',              # pip install citeurl
-  #'pymdownx.escapeall',  # what do I have to install for this to work?
-  'markdown_del_ins',     # pip install markdown-del-ins ~~del~~ ++ins++
-  UnderlineExtension(),   # override _italics_ and __bold__ to leave 4 or more _ unmolested.
-])
-
-def convert(new_path):
-    r'''Convert the markdown contents of new_path to html and return it.
-    '''
-    #log("converting", filename, "from markdown to html")
-    with open(new_path, 'rt') as file: 
-        return md.convert(file.read())
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin'))
+from motions.index import Motion_index
 
 
 def gen_auth():
@@ -48,35 +25,161 @@ def gen_auth():
 
 
 class Event_handler(FileSystemEventHandler):
-    def __init__(self, auth, watch_dir, url):
+    r'''Converts and posts each modified file.
+
+    Editors send several modify events per save, so each file waits until it's been quiet for
+    debounce seconds before it's converted.  If the html is the same as what was posted last, it
+    isn't posted again.  self.counts keeps track of how much work this saves.
+
+    The meeting's metadata/current is watched too.  When it changes (the chair ran 'next',
+    'start', etc), the new current motion is posted, and the rest of the agenda is rendered ahead
+    of time (render caches each file's html until it changes), so the next one is ready.
+
+    With current_only, only the current motion is posted when it's modified, and the files
+    matching the also patterns.  Edits to anything else (other motions, scratch files, tmp.*
+    from --dry-run) aren't rendered or shown to the audience.
+    '''
+    def __init__(self, auth, watch_dir, url, debounce=0.2, current_only=False, also=()):
         super().__init__()
         self.auth = auth
         self.watch_dir = watch_dir
         self.url = url
+        self.debounce = debounce
+        self.current_only = current_only
+        self.also = also
+        self.session = requests.Session()  # keeps the connection to meeting.py open
+        self.sender = Sender(self)
         self.ignore = None
+        self.metadata_dir = os.path.join(watch_dir, 'metadata')
+        self.current = None         # filename of the current motion, see current_path
+        self.current_path()
+        self.index = None           # Motion_index, for the agenda
+        self.timers = {}            # src_path: Timer
+        self.lock = threading.Lock()
+        self.render_lock = threading.Lock()
+        self.prerender_lock = threading.Lock()    # for self.index, and one prerender at a time
+        self.last_posted = None     # (filename, sha1 of html)
+        self.counts = Counter()     # events, coalesced, unchanged, superseded, posted, retries
 
     def on_modified(self, event):
         if isinstance(event, FileModifiedEvent):
             src_path = event.src_path
             filename = os.path.basename(src_path)
-            if filename[0] != '.' and not filename.isdigit() and filename != 'metadata' \
+            if os.path.dirname(src_path) == self.metadata_dir:
+                if filename == 'current':
+                    self.schedule(src_path, self.current_changed)
+            elif filename[0] != '.' and not filename.isdigit() and filename != 'metadata' \
                and filename != self.ignore:
-                print()
-                print("on_modified got", filename)
-                contents = convert(src_path)
-                self.post(filename, contents)
+                if self.current_only and filename != self.current \
+                   and not any(fnmatchcase(filename, pattern) for pattern in self.also):
+                    self.counts['not current'] += 1
+                    return
+                self.counts['events'] += 1
+                self.schedule(src_path, self.render)
+
+    def schedule(self, src_path, fn):
+        r'''Calls fn(src_path) once src_path has been quiet for debounce seconds.
+        '''
+        if not self.debounce:
+            fn(src_path)
+            return
+        with self.lock:
+            timer = self.timers.get(src_path)
+            if timer is not None:
+                timer.cancel()
+                self.counts['coalesced'] += 1
+            timer = self.timers[src_path] = threading.Timer(self.debounce, fn, (src_path,))
+            timer.start()
+
+    def current_path(self):
+        r'''Returns the path of the current motion, from metadata/current, or None.
+
+        Also sets self.current.
+        '''
+        try:
+            with open(os.path.join(self.metadata_dir, 'current')) as file:
+                name = file.read().split()[0]
+        except (OSError, IndexError):
+            return None
+        self.current = name
+        path = os.path.join(self.watch_dir, name)
+        if not os.path.isfile(path):
+            return None
+        return path
+
+    def warm_start(self):
+        r'''Posts the current motion, then renders the rest of the agenda.
+
+        Run in its own thread at startup, so the viewers don't have to wait for the chair to save
+        something.
+        '''
+        current = self.current_path()
+        if current is not None:
+            print("warm start posting", os.path.basename(current))
+            self.render(current)
+        self.prerender()
+
+    def current_changed(self, src_path):
+        with self.lock:
+            self.timers.pop(src_path, None)
+        current = self.current_path()
+        if current is not None:
+            self.render(current)
+        self.prerender()
+
+    def prerender(self):
+        r'''Renders the motions left on the agenda, in order, without posting them.
+
+        The ones already rendered (and not touched since) are skipped by render.prerender.  This
+        is run by the warm start thread and the timer threads, so they take turns.
+        '''
+        with self.prerender_lock:
+            if self.index is None:
+                self.index = Motion_index(Path(self.metadata_dir), Path(self.watch_dir))
+            else:
+                self.index.refresh()
+            for name in self.index.remaining():
+                path = os.path.join(self.watch_dir, name)
+                if os.path.isfile(path):
+                    with self.render_lock:
+                        prerender(path)
+                    self.counts['prerendered'] += 1
+
+    def render(self, src_path):
+        r'''Converts src_path and posts it, unless it's unchanged since the last post.
+        '''
+        with self.lock:
+            self.timers.pop(src_path, None)
+        filename = os.path.basename(src_path)
+        with self.render_lock:
+            print()
+            print("on_modified got", filename)
+            contents = convert(src_path)
+            digest = filename, hashlib.sha1(contents.encode('utf-8')).digest()
+            if digest == self.last_posted:
+                self.counts['unchanged'] += 1
+                print("watcher skipped", filename, "unchanged")
+            else:
+                self.sender.send(filename, contents)
+                self.last_posted = digest
                 if contents:
-                    print("watcher sent", contents[:contents.find('\n')], "...")
+                    print("watcher queued", contents[:contents.find('\n')], "...")
                 else:
-                    print("watcher sent empty file")
+                    print("watcher queued empty file")
+            print("watcher counts", dict(self.counts))
 
     def post(self, filename, content):
-        r = requests.put(self.url,
-                         params={'filename': filename},
-                         headers={'content-type': 'text/html: charset=utf-8',
-                                  'Authorization': gen_auth(),
-                                 },
-                         data=content.encode('utf-8'))
+        r'''Puts content to meeting.py and returns the response.
+
+        Raises requests.RequestException if meeting.py can't be reached.
+        '''
+        r = self.session.put(self.url,
+                             params={'filename': filename},
+                             headers={'content-type': 'text/html: charset=utf-8',
+                                      'Authorization': gen_auth(),
+                                     },
+                             data=content.encode('utf-8'),
+                             timeout=(5, 30))
         print("post sent headers", r.request.headers)
         print("post got status", r.status_code, r.reason)
         print("post got headers", r.headers)
@@ -95,9 +198,56 @@ class Event_handler(FileSystemEventHandler):
         else: # got error from server
             if int(r.headers['content-length']):
                 print("post got text", r.text)
+        return r
 
 
-def watcher(auth, watch_dir, url):
+class Sender(threading.Thread):
+    r'''Posts the latest rendered file to meeting.py.
+
+    Event_handler.render hands each file to send(), which never blocks.  If the network is slow, a
+    file that's still waiting is replaced by the newer one, since the audience only needs the
+    latest.  Failed posts are retried with exponential backoff, up to max_backoff seconds.
+    '''
+    def __init__(self, handler, max_backoff=10):
+        super().__init__(name='sender', daemon=True)
+        self.handler = handler
+        self.max_backoff = max_backoff
+        self.pending = None       # (filename, contents)
+        self.cond = threading.Condition()
+
+    def send(self, filename, contents):
+        with self.cond:
+            if self.pending is not None:
+                self.handler.counts['superseded'] += 1
+            self.pending = filename, contents
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending is not None)
+                filename, contents = self.pending
+                self.pending = None
+            backoff = 0.5
+            while True:
+                try:
+                    r = self.handler.post(filename, contents)
+                    if r.status_code < 500:
+                        self.handler.counts['posted'] += 1
+                        break
+                    print("sender got status", r.status_code, "for", filename)
+                except requests.RequestException as e:
+                    print("sender got", repr(e), "for", filename)
+                self.handler.counts['retries'] += 1
+                print("sender retrying in", backoff, "seconds")
+                with self.cond:
+                    # a newer file replaces this one
+                    if self.cond.wait_for(lambda: self.pending is not None, backoff):
+                        break
+                backoff = min(backoff * 2, self.max_backoff)
+
+
+def watcher(auth, watch_dir, url, debounce, current_only=False, also=()):
     r'''listens for changes to watch_dir and posts html to app['events'].
 
     As the changes come in, this converts the files from markdown to html and pushes the html to each
@@ -106,10 +256,16 @@ def watcher(auth, watch_dir, url):
     global event_handler
     print("watcher auth", auth, "watching", watch_dir, "posting to", url)
     observer = Observer()
-    event_handler = Event_handler(auth, watch_dir, url)
+    event_handler = Event_handler(auth, watch_dir, url, debounce, current_only, also)
+    if current_only and not os.path.isdir(event_handler.metadata_dir):
+        print("watcher: WARNING no metadata directory, so only", also, "will be posted")
     observer.schedule(event_handler, watch_dir, recursive=False)
+    if os.path.isdir(event_handler.metadata_dir):
+        observer.schedule(event_handler, event_handler.metadata_dir, recursive=False)
     try:
+        event_handler.sender.start()
         observer.start()
+        threading.Thread(target=event_handler.warm_start, name='warm start', daemon=True).start()
         observer.join()
     finally:
         print("capturing log file")
@@ -133,6 +289,16 @@ parser.add_argument('auth', help='must provide same auth key to meeting.py!')
 parser.add_argument('watch_dir', help='posts all changes in this directory')
 parser.add_argument('url', nargs='?', default='http://70.126.41.242:8080/change',
                     help='url to post change to')
+parser.add_argument('--debounce', '-d', type=float, default=0.2,
+                    help='seconds a file must be quiet before it is posted, 0 to post every event')
+parser.add_argument('--room', '-r', help="post to this meeting's room on the server")
+parser.add_argument('--current-only', '-c', default=False, action='store_true',
+                    help="only post the current motion (in metadata/current) when it changes")
+parser.add_argument('--also', '-a', action='append', default=[], metavar='PATTERN',
+                    help="with --current-only, also post files matching PATTERN (e.g. 'notes*')")
 args = parser.parse_args()
 
-watcher(args.auth, args.watch_dir, args.url)
+if args.room:
+    args.url = urljoin(args.url, f"{args.room}/change")
+
+watcher(args.auth, args.watch_dir, args.url, args.debounce, args.current_only, args.also)